@@ -0,0 +1,231 @@
+import time
+import pylibftdi as ftdi
+import framing
+import timing
+import decoder
+import sensor_output as out
+
+class Acquisition:
+	"""
+	Continuous data acquisition from a Sensor in the calling thread.
+	This replaces the start/scan/CRC/decode/stop loops of the recording scripts: the stream is read in large chunks,
+	framed by framing.frame_sync (which checks both checksums and counts lost frames) and decoded with the
+	sensor's ADC settings and calibration matrix. Samples can be taken one at a time as sensor_output objects
+	(or compact decoder.sample objects), or in fixed-size batches as structured arrays (see decoder.PACKET_DTYPE).
+	Every chunk read is checked for saturation as a block, and the per-channel counts of the session are kept in saturation
+	(see decoder.saturation_monitor)
+
+	To use:
+		acq = Acquisition(sensor)
+		acq.start(1500)
+		for sample in acq.samples(n_samples=30000):
+			...
+		acq.stop()
+		acq.stats.string()
+		acq.saturation.string()
+	"""
+
+	def __init__(self, sensor, chunk_size=4096, eager=None):
+		"""
+		:param sensor the Sensor to acquire data from. It cannot be sent other commands while acquiring
+		:param chunk_size how many bytes to request from the port per read
+		:param eager names of the sensor_output fields to decode as soon as a packet is parsed, e.g. ('wrench',).
+			The other fields are decoded when first read. Defaults to the sensor's setting (see Sensor.eager)
+		"""
+		self.sensor = sensor
+		self.eager = sensor.eager if eager == None else eager
+		self.framer = framing.frame_sync(sensor.port, sensor.crc8_table, sensor.crc32_table, chunk_size)
+		self.stats = self.framer.stats
+		self.saturation = decoder.saturation_monitor()
+		self.clock = timing.sample_clock()
+		self.running = False
+		self.timed_out = False
+		self.error_count = 0
+
+	def start(self, data_rate=1500):
+		"""
+		Start continuous transmission of data from the sensor
+		:param data_rate the sample rate in Hz (up to 16 bits)
+		:return True if the transmission was started
+		"""
+		if self.sensor.block:
+			print('Failed. In continuous data mode already. Call stop() first.')
+			return False
+		self.framer.reset()
+		self.saturation.reset()
+		self.clock = timing.sample_clock(data_rate)
+		self.timed_out = False
+		self.sensor.port.write(self.sensor.toStr([0x10, (data_rate >> 8) & 0xFF, data_rate & 0xFF], with_crc8=True))
+		self.sensor.block = True
+		self.sensor.data_rate = data_rate
+		self.running = True
+		self.start_time = time.time()
+		return True
+
+	def stop(self):
+		"""
+		Stop continuous transmission of data and drain the receive buffer (see Sensor.stop_stream)
+		:return True if the sensor stopped sending
+		"""
+		stopped = self.sensor.stop_stream()
+		self.sensor.block = False
+		self.running = False
+		return stopped
+
+	def read(self):
+		"""
+		Read one chunk from the port
+		:return generator of the 53 byte packets that are now complete
+		"""
+		try:
+			return self.framer.read_frames()
+		except ftdi._base.FtdiError:
+			print('FTDI Error thrown while reading')
+			self.error_count += 1
+			if self.error_count == 10:
+				raise ftdi._base.FtdiError('Failed too many times. Exiting...')
+			return iter(())
+
+	def frame(self):
+		"""
+		Frame information of the packet the framer returned last, which updates the sample clock.
+		Call it once for every packet, while that packet is being handled
+		:return counter, dropped, duplicate, index, rx_time, time (see sensor_output)
+		"""
+		framer = self.framer
+		return (framer.counter, framer.dropped, framer.duplicate, framer.index, framer.rx_time,
+			self.clock.update(framer.index, framer.rx_time))
+
+	def parse(self, packet, frame=None):
+		"""
+		Parse one 53 byte packet using the sensor's ADC settings and calibration matrix
+		:param frame the frame information of the packet (see frame()). Taken from the framer if None
+		:return sensor_output object, including the frame counter information and timestamps
+		"""
+		if frame == None:
+			frame = self.frame()
+		sample = out.sensor_output(self.sensor, packet, self.sensor.rep_ids.get(packet[36]), self.sensor.calMatrix, self.eager)
+		sample.counter, sample.dropped, sample.duplicate, sample.index, sample.rx_time, sample.time = frame
+		return sample
+
+	def decode(self, chunk, raw=False):
+		"""
+		Decode many packets at once, including their frame information
+		:param chunk list of (packet, frame) pairs (see chunks())
+		:param raw if True, keep the values as raw counts (see decoder.decode_raw)
+		:return structured array with the fields of decoder.PACKET_DTYPE (decoder.RAW_DTYPE if raw)
+		"""
+		packets = bytearray().join([packet for packet, frame in chunk])
+		block = decoder.decode_raw(packets) if raw else decoder.decode_packets(packets, self.sensor)
+		if chunk:
+			counter, dropped, duplicate, index, rx_time, times = zip(*[frame for packet, frame in chunk])
+			block['counter'] = counter
+			block['dropped'] = dropped
+			block['duplicate'] = duplicate
+			block['index'] = index
+			block['rx_time'] = rx_time
+			block['time'] = times
+		return block
+
+	def __decode(self, chunk, raw=False):
+		"""
+		Decode packets streamed by __chunks(check=False) and count their saturation from the decoded values
+		"""
+		block = self.decode(chunk, raw)
+		self.saturation.update(decoder.raw_saturation(block, self.sensor) if raw else block['saturated'])
+		return block
+
+	def chunks(self, n_samples=None, duration=None, timeout=1.0):
+		"""
+		Stream raw packets, grouped by the read from the port that completed them, until a sample target or deadline is reached
+		:param n_samples stop after this many packets. None for no limit
+		:param duration stop after this many seconds. None for no limit
+		:param timeout stop if no packet arrives for this many seconds (timed_out is then set to True)
+		:return generator of lists of (packet, frame) pairs, where packet is a 53 byte bytearray and frame its frame information (see frame())
+		"""
+		return self.__chunks(n_samples, duration, timeout)
+
+	def __chunks(self, n_samples=None, duration=None, timeout=1.0, check=True):
+		"""
+		:param check if True, check every chunk for saturation. The callers that decode the chunks anyway
+			pass False and count the saturation from the decoded values instead (see __decode)
+		"""
+		deadline = None if duration == None else time.time() + duration
+		count = 0
+		last = time.time()
+		while n_samples == None or count < n_samples:
+			now = time.time()
+			if deadline != None and now >= deadline:
+				return
+			chunk = []
+			for packet in self.read():
+				chunk.append((packet, self.frame()))
+				count += 1
+				if count == n_samples:
+					break
+			if chunk:
+				last = now
+				if check:
+					self.saturation.update(decoder.decode_saturation(bytearray().join([packet for packet, frame in chunk]), self.sensor))
+				yield chunk
+			elif now - last > timeout:
+				print('No data received for ' + str(timeout) + ' sec')
+				self.timed_out = True
+				return
+			else:
+				#Nothing buffered yet. Yield the GIL instead of spinning on the port
+				time.sleep(0.0005)
+
+	def packets(self, n_samples=None, duration=None, timeout=1.0):
+		"""
+		Stream raw packets until a sample target or deadline is reached (see chunks())
+		:return generator of 53 byte packets (bytearrays)
+		"""
+		for chunk in self.chunks(n_samples, duration, timeout):
+			for packet, frame in chunk:
+				yield packet
+
+	def samples(self, n_samples=None, duration=None, timeout=1.0, compact=False):
+		"""
+		Stream parsed samples until a sample target or deadline is reached (see chunks())
+		:param compact if True, decode each read in one block and return decoder.sample objects,
+			which have the same attributes as sensor_output but take a fraction of the memory and time
+		:return generator of sensor_output (or decoder.sample) objects
+		"""
+		for chunk in self.__chunks(n_samples, duration, timeout, not compact):
+			if compact:
+				block = self.__decode(chunk)
+				for i in range(len(block)):
+					yield decoder.sample(block, i)
+			else:
+				for packet, frame in chunk:
+					yield self.parse(packet, frame)
+
+	def batches(self, batch_size, n_samples=None, duration=None, timeout=1.0, raw=False):
+		"""
+		Stream decoded samples in fixed-size batches until a sample target or deadline is reached (see chunks()).
+		The last batch may be shorter
+		:param batch_size the number of samples per batch
+		:param raw if True, keep the values as raw counts (see decoder.decode_raw)
+		:return generator of structured arrays with the fields of decoder.PACKET_DTYPE (decoder.RAW_DTYPE if raw)
+		"""
+		block = []
+		for chunk in self.__chunks(n_samples, duration, timeout, False):
+			block.extend(chunk)
+			while len(block) >= batch_size:
+				yield self.__decode(block[:batch_size], raw)
+				block = block[batch_size:]
+		if block:
+			yield self.__decode(block, raw)
+
+	def record(self, n_samples=None, duration=None, timeout=1.0, raw=False):
+		"""
+		Acquire and decode everything until a sample target or deadline is reached
+		:param raw if True, keep the values as raw counts, which take less than half the memory.
+			Convert them later with decoder.convert_raw
+		:return structured array with the fields of decoder.PACKET_DTYPE (decoder.RAW_DTYPE if raw)
+		"""
+		rec = decoder.recording(dtype=decoder.RAW_DTYPE if raw else decoder.PACKET_DTYPE)
+		for chunk in self.__chunks(n_samples, duration, timeout, False):
+			rec.append(self.__decode(chunk, raw))
+		return rec.array()
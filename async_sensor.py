@@ -0,0 +1,200 @@
+import asyncio
+import collections
+import functools
+import threading
+import time
+from concurrent import futures
+import pylibftdi as ftdi
+from acquisition import Acquisition
+
+class AsyncSensor:
+	"""
+	asyncio client for a Sensor.
+	All FTDI I/O runs in a dedicated single-thread executor, so the event loop never blocks on the port
+	and commands are never interleaved with each other or with the data stream. Commands return awaitable
+	futures and the data stream is an async iterator of sensor_output objects. Samples are handed to the
+	event loop once per chunk read from the port, not once per packet.
+
+	The class is written with futures and callbacks rather than async def so that it still compiles
+	alongside the Python 2 code. It needs Python 3 to run.
+
+	To use (inside a coroutine):
+		s = AsyncSensor(Sensor(calMatrix))
+		sample = await s.poll()
+		await s.command('config_dac', 0, 2.0)
+		await s.start(1500)
+		async for sample in s:
+			...
+			if done:
+				break
+		await s.stop()
+		await s.close()
+	"""
+
+	def __init__(self, sensor, loop=None, capacity=8192, chunk_size=4096, timeout=1.0):
+		"""
+		:param sensor the Sensor to control. It should not be used directly while this object owns it
+		:param loop the event loop to deliver results to. Defaults to the running event loop, so without it
+			the object must be created inside a coroutine (asyncio.get_running_loop raises RuntimeError otherwise)
+		:param capacity the number of samples buffered for the iterator before the oldest are overwritten
+		:param chunk_size how many bytes to request from the port per read
+		:param timeout end the stream if no data arrives for this many seconds
+		"""
+		self.sensor = sensor
+		self.loop = loop if loop != None else asyncio.get_running_loop()
+		self.executor = futures.ThreadPoolExecutor(max_workers=1)
+		self.acq = Acquisition(sensor, chunk_size)
+		self.stats = self.acq.stats
+		self.capacity = capacity
+		self.timeout = timeout
+		self.pending = collections.deque() #Samples received but not yet taken by the iterator
+		self.waiters = collections.deque() #Futures of iterator steps waiting for a sample
+		self.overwritten = 0
+		self.streaming = False
+		self.error = None
+		self.stopping = threading.Event()
+
+	def call(self, fn, *args, **kwargs):
+		"""
+		Run a blocking function in the I/O executor
+		:return asyncio future with the result of fn(*args, **kwargs)
+		"""
+		return self.loop.run_in_executor(self.executor, functools.partial(fn, *args, **kwargs))
+
+	def command(self, name, *args, **kwargs):
+		"""
+		Call one of the Sensor's methods in the I/O executor, e.g. command('config_dac', 0, 2.0)
+		Commands submitted while streaming run after the stream is stopped
+		:param name the name of the Sensor method
+		:return asyncio future with the method's return value
+		"""
+		return self.call(getattr(self.sensor, name), *args, **kwargs)
+
+	def poll(self):
+		"""
+		:return asyncio future with one sensor_output object
+		"""
+		return self.command('poll')
+
+	def start(self, data_rate=1500):
+		"""
+		Start continuous transmission of data and begin streaming samples to the iterator
+		:param data_rate the sample rate in Hz (up to 16 bits)
+		:return asyncio future which is True if the transmission was started
+		"""
+		if self.streaming:
+			print('Failed. In continuous data mode already. Call stop() first.')
+			started = self.loop.create_future()
+			started.set_result(False)
+			return started
+		self.stopping.clear()
+		self.pending.clear()
+		self.error = None
+		self.streaming = True
+		started = self.call(self.acq.start, data_rate)
+		self.call(self.__run)
+		return started
+
+	def stop(self):
+		"""
+		Stop continuous transmission of data. Samples received before the stop can still be iterated over
+		:return asyncio future which is done once the sensor has stopped sending
+		"""
+		self.stopping.set()
+		return self.call(self.__stop)
+
+	def close(self):
+		"""
+		Stop streaming if need be, disconnect the sensor and shut down the I/O executor
+		:return asyncio future which is done once the sensor is disconnected
+		"""
+		self.stopping.set()
+		closed = self.call(self.__close)
+		closed.add_done_callback(lambda f: self.executor.shutdown(wait=False))
+		return closed
+
+	def __stop(self):
+		if self.acq.running:
+			self.acq.stop()
+
+	def __close(self):
+		self.__stop()
+		self.sensor.disconnect()
+
+	def __run(self):
+		"""
+		Read the port until stop() is called, the data times out or the port fails, then stop the transmission. Runs in the I/O executor
+		"""
+		error = None
+		last = time.time()
+		try:
+			while self.acq.running and not self.stopping.is_set():
+				samples = [self.acq.parse(packet) for packet in self.acq.read()]
+				now = time.time()
+				if samples:
+					last = now
+					self.loop.call_soon_threadsafe(self.__deliver, samples)
+				elif now - last > self.timeout:
+					print('No data received for ' + str(self.timeout) + ' sec')
+					self.acq.timed_out = True
+					break
+				else:
+					#Nothing buffered yet. Yield the GIL instead of spinning on the port
+					time.sleep(0.0005)
+		except ftdi._base.FtdiError as e:
+			error = e
+		finally:
+			#Stop here rather than in a later job, so that commands queued while streaming run after the stream is stopped
+			if self.acq.running:
+				self.acq.stop()
+		self.loop.call_soon_threadsafe(self.__end, error)
+
+	def __deliver(self, samples):
+		"""
+		Hand samples to waiting iterator steps and buffer the rest. Runs in the event loop
+		"""
+		for sample in samples:
+			while self.waiters and self.waiters[0].done(): #Cancelled
+				self.waiters.popleft()
+			if self.waiters:
+				self.waiters.popleft().set_result(sample)
+			else:
+				self.pending.append(sample)
+				if len(self.pending) > self.capacity:
+					self.pending.popleft()
+					self.overwritten += 1
+
+	def __end(self, error):
+		"""
+		Mark the stream as finished and end all waiting iterator steps. Runs in the event loop
+		"""
+		self.streaming = False
+		self.error = error
+		while self.waiters:
+			self.__finish(self.waiters.popleft())
+
+	def __finish(self, waiter):
+		if waiter.done():
+			return
+		if self.error != None:
+			waiter.set_exception(self.error)
+			self.error = None
+		else:
+			waiter.set_exception(StopAsyncIteration())
+
+	def __aiter__(self):
+		return self
+
+	def __anext__(self):
+		"""
+		:return awaitable with the next sample. Raises StopAsyncIteration once the stream has ended
+			and all buffered samples were taken, or the FtdiError that ended it
+		"""
+		step = self.loop.create_future()
+		if self.pending:
+			step.set_result(self.pending.popleft())
+		elif self.streaming:
+			self.waiters.append(step)
+		else:
+			self.__finish(step)
+		return step
@@ -3,6 +3,11 @@ import numpy as np
 import csv
 import struct
 
+try:
+    long
+except NameError: #Python 3 has no separate long type
+    long = int
+
 def toBytesList(num):
         """
         Split an int into a list of bytes
@@ -23,211 +28,359 @@ def crc4(p, polynomial=0x3, table=[]):
     """
     Calculates the CRC-4 checksum of a number by bitwise operations or by
     using a lookup table
-    :param p is the list of bytes to find the CRC of (list of ints)
+    :param p is the bytes to find the CRC of (bytes, bytearray, memoryview, list of ints or an int)
     :param polynomial the divisor polynomial to use
         Default is 0x3
     :param table provide the lookup table to calculate CRC that way
-    	Is faster with table but can also be done without
-    	Leave unset to calculate using bitwise operations instead
+        Is faster with table but can also be done without
+        Leave unset to calculate using bitwise operations instead
     :return the CRC4 checksum as an int
     """
     if type(p) == int or type(p) == long:
         p = toBytesList(p)
+    elif isinstance(p, (bytes, memoryview)):
+        p = bytearray(p) #Index to ints on Python 2 too
 
     #Initialize CRC to 0    
     crc = 0
     length = len(p)
 
-    if table == []:
+    if len(table) == 0:
         for j in range(length):
-	    crc ^= p[j]
-	    for i in range(8): #Iterate through each bit
-	        if crc & 0x80 != 0: #If MSD is 1
-	            crc = ((crc << 1) & 0xFF) ^ (polynomial << 4)
-	        else: #Shift the CRC so the MSD is 1
-	            crc <<= 1
-	            crc &= 0xFF #Don't keep anything beyond 8 bits
+            crc ^= p[j]
+            for i in range(8): #Iterate through each bit
+                if crc & 0x80 != 0: #If MSD is 1
+                    crc = ((crc << 1) & 0xFF) ^ (polynomial << 4)
+                else: #Shift the CRC so the MSD is 1
+                    crc <<= 1
+                    crc &= 0xFF #Don't keep anything beyond 8 bits
         return crc >> 4
     else: 
-	for i in range(length):
-	    #XOR-in next input byte into MSB of crc and get this MSB, that's our new intermediate divident
-	    pos = (crc << 4 ^ (p[i])) & 0xFF
+        for i in range(length):
+            #XOR-in next input byte into MSB of crc and get this MSB, that's our new intermediate divident
+            pos = (crc << 4 ^ (p[i])) & 0xFF
             #Update the CRC from the Lookup table
-            crc = int(table[pos])
+            crc = table[pos]
         return crc
 
-def calculate_CRC4_table():
+class crc8_stream:
     """
-    Generates a lookup table to find the CRC-4 checksum of a number
-    :return the table as a list of 256 values
+    CRC-8 checksum (as crc8) of a message that arrives in pieces.
+    To use, call update() with each piece in order and digest() for the checksum so far
     """
-    polynomial = 0x3;
-    row = []
-    CRC4_table = np.zeros(256)
-    with open('CRC4_LUT.csv','w') as csvfile:
-        outfile = csv.writer(csvfile, delimiter=',', quotechar='"', quoting=csv.QUOTE_MINIMAL)
-        i = 0
-        for dividend in range(256): # iterate over all possible input byte values 0 - 255
-            curByte = dividend & 0xFF;
-            for bit in range(8):
-                if (curByte & 0x80) != 0:
-                    curByte <<= 1
-                    curByte ^=  (polynomial << 4)
-                    curByte &= 0xFF
-                else:
-                    curByte <<= 1
-                    curByte &= 0xFF
-            curByte >>= 4
-            
-            row.append(hex(curByte))
-            if ((dividend+1)%16 == 0):
-                outfile.writerow(row)
-                row = []
-                
-            CRC4_table[i] = curByte
-            i += 1
-            
-            
-        return CRC4_table
+    def __init__(self, data=None, table=None):
+        """
+        :param data optional first piece of the message
+        :param table the CRC-8 lookup table. Default is CRC8_TABLE
+        """
+        self.table = CRC8_TABLE if table is None else table
+        self.crc = 0
+        if data != None:
+            self.update(data)
+
+    def update(self, data, start=0, end=None):
+        """
+        Add the next piece of the message
+        :param data the bytes to add (bytes, bytearray, memoryview or list of ints)
+        :param start index of the first byte of data to include
+        :param end index after the last byte to include. Default is the end of data
+        :return self
+        """
+        table = self.table
+        crc = self.crc
+        for byte in bytearray(data[start:end]):
+            crc = table[crc ^ byte]
+        self.crc = crc
+        return self
+
+    def digest(self):
+        """
+        :return the CRC-8 checksum of all bytes added so far as an int
+        """
+        return self.crc
+
+    def reset(self):
+        """
+        Start a new message
+        """
+        self.crc = 0
+
+class crc32_stream:
+    """
+    CRC-32 checksum (as crc32) of a message that arrives in pieces, e.g. across USB reads,
+    without joining the pieces first. Uses crc32_slice8.
+    To use, call update() with each piece in order and digest() for the checksum so far
+    """
+    def __init__(self, data=None, tables=None):
+        """
+        :param data optional first piece of the message
+        :param tables the 8 lookup tables as returned by slice_tables(). Default is CRC32_SLICE_TABLES
+        """
+        self.tables = tables
+        self.crc = 0
+        if data != None:
+            self.update(data)
+
+    def update(self, data, start=0, end=None):
+        """
+        Add the next piece of the message
+        :param data the bytes to add (bytes, bytearray, memoryview or list of ints)
+        :param start index of the first byte of data to include
+        :param end index after the last byte to include. Default is the end of data
+        :return self
+        """
+        self.crc = crc32_slice8(data, start, end, self.tables, self.crc)
+        return self
+
+    def digest(self):
+        """
+        :return the CRC-32 checksum of all bytes added so far as an int
+        """
+        return self.crc
+
+    def reset(self):
+        """
+        Start a new message
+        """
+        self.crc = 0
+
+def calculate_CRC4_table(csv_file=None):
+    """
+    Get the lookup table to find the CRC-4 checksum of a number.
+    The table is built once when the module is imported
+    :param csv_file optionally also write the table to this CSV file as hex values, 16 per row
+    :return the table as a tuple of 256 ints
+    """
+    if csv_file != None:
+        write_table(csv_file, CRC4_TABLE, 16)
+    return CRC4_TABLE
 
 def crc32(p, polynomial=0x04C11DB7, table=[]):
     """
     Calculates the CRC-32 checksum of a number using bitwise operations
     or with a lookup table
-    :param p is the list of bytes to find the CRC of (list of ints)
+    :param p is the bytes to find the CRC of (bytes, bytearray, memoryview, list of ints or an int)
     :param polynomial the divisor polynomial to use
         Default is 0x04C11DB7
     :param table provide the lookup table to calculate CRC that way
-    	Is faster with table but can also be done without
-    	Leave unset to calculate using bitwise operations instead
+        Is faster with table but can also be done without
+        Leave unset to calculate using bitwise operations instead
     :return the CRC32 checksum as an int
     """
 
     if type(p) == int or type(p) == long:
         p = toBytesList(p)
+    elif isinstance(p, (bytes, memoryview)):
+        p = bytearray(p) #Index to ints on Python 2 too
 
     length = len(p)
     crc = 0 #CRC value is 32bit
 
-    if table == []:
+    if len(table) == 0:
         for j in range(length):
-	    crc ^= (p[j] << 24) # move byte into MSB of 32bit CRC
-	    crc &= 0xFFFFFFFF #Keep crc 32 bits
-	        
-	    for i in range(8):
-	        if (crc & 0x80000000) != 0: #test for MSB = bit 31
-	            crc = ((crc << 1) ^ polynomial) & 0xFFFFFFFF
-	        else:
-	            crc <<= 1;
-	            crc &= 0xFFFFFFFF #Keep crc 32 bits
+            crc ^= (p[j] << 24) # move byte into MSB of 32bit CRC
+            crc &= 0xFFFFFFFF #Keep crc 32 bits
+                
+            for i in range(8):
+                if (crc & 0x80000000) != 0: #test for MSB = bit 31
+                    crc = ((crc << 1) ^ polynomial) & 0xFFFFFFFF
+                else:
+                    crc <<= 1;
+                    crc &= 0xFFFFFFFF #Keep crc 32 bits
     else: 
         for i in range(length):
-	    #XOR-in next input byte into MSB of crc and get this MSB, that's our new intermediate dividend
-	    pos = ((crc ^ (p[i] << 24)) >> 24) & 0xFF
-	    #Shift out the MSB used for division per lookup table and XOR with the remainder
-	    crc = ((crc << 8) ^ int(table[pos])) & 0xFFFFFFFF
+            #XOR-in next input byte into MSB of crc and get this MSB, that's our new intermediate dividend
+            pos = ((crc ^ (p[i] << 24)) >> 24) & 0xFF
+            #Shift out the MSB used for division per lookup table and XOR with the remainder
+            crc = ((crc << 8) ^ table[pos]) & 0xFFFFFFFF
+
+    return crc
+
+
+def crc32_slice8(data, start=0, end=None, tables=None, crc=0):
+    """
+    Calculates the same CRC-32 checksum as crc32 (MSB first, polynomial 0x04C11DB7, initial value 0)
+    8 bytes at a time, using 8 lookup tables ("slicing-by-8"), which takes far fewer Python operations per byte.
+    The bytes are read as big-endian words directly from the buffer, without converting them one by one
+    :param data the bytes to find the CRC of (bytes, bytearray, memoryview or list of ints)
+    :param start index of the first byte to include
+    :param end index after the last byte to include. Default is the end of data
+    :param tables the 8 lookup tables as returned by slice_tables(). Default is CRC32_SLICE_TABLES
+    :param crc the CRC of the preceding bytes, to continue a checksum over several calls
+    :return the CRC32 checksum as an int
+    """
+    if isinstance(data, list):
+        data = bytearray(data)
+    if end == None:
+        end = len(data)
+    T0, T1, T2, T3, T4, T5, T6, T7 = CRC32_SLICE_TABLES if tables == None else tables
+
+    blocks = (end - start) >> 3
+    words = struct.unpack_from('>%dI' % (2*blocks), data, start)
+    for i in range(0, 2*blocks, 2):
+        one = crc ^ words[i]
+        two = words[i + 1]
+        crc = (T7[one >> 24] ^ T6[(one >> 16) & 0xFF] ^ T5[(one >> 8) & 0xFF] ^ T4[one & 0xFF] ^
+            T3[two >> 24] ^ T2[(two >> 16) & 0xFF] ^ T1[(two >> 8) & 0xFF] ^ T0[two & 0xFF])
+
+    #Remaining bytes one at a time
+    for byte in bytearray(data[start + 8*blocks:end]):
+        crc = ((crc << 8) & 0xFFFFFFFF) ^ T0[(crc >> 24) ^ byte]
+    return crc
 
+def crc32_array(data, table=None):
+    """
+    Calculates the CRC-32 checksum (as crc32) of many messages at once.
+    The messages are processed in parallel, one byte position at a time
+    :param data (N, L) uint8 array with one message per row
+    :param table the CRC-32 lookup table. Default is CRC32_TABLE
+    :return uint32 array of the N checksums
+    """
+    data = np.asarray(data, dtype=np.uint8)
+    table = np.asarray(CRC32_TABLE if table is None else table, dtype=np.uint32)
+    crc = np.zeros(len(data), dtype=np.uint32)
+    for j in range(data.shape[1]):
+        crc = (crc << 8) ^ table[(crc >> 24) ^ data[:, j]]
     return crc
 
+def crc32_batch(data, checksums, table=None):
+    """
+    Check the CRC-32 checksums of many messages at once
+    :param data (N, L) uint8 array with one message per row, e.g. the first 49 bytes of N packets
+    :param checksums (N, 4) uint8 array of the checksums as sent (MSB first), or array of N ints
+    :param table the CRC-32 lookup table. Default is CRC32_TABLE
+    :return boolean array which is True where the checksum matches
+    """
+    checksums = np.asarray(checksums)
+    if checksums.ndim == 2:
+        cs = checksums.astype(np.uint32)
+        checksums = (cs[:, 0] << 24) | (cs[:, 1] << 16) | (cs[:, 2] << 8) | cs[:, 3]
+    return crc32_array(data, table) == checksums
 
-def calculate_CRC32_table():
+def slice_tables(table):
     """
-    Generates a lookup table to find the CRC-32 checksum of a number
-    :return the table as a list of 256 ints
+    Extend a CRC-32 lookup table to the 8 tables used by crc32_slice8.
+    Table k gives the CRC of a byte followed by k zero bytes
+    :param table the CRC-32 lookup table (see calculate_CRC32_table)
+    :return tuple of 8 tables
     """
-    polynomial = 0x04C11DB7;
-    row = []
-    CRC32_table = np.zeros(256)
-    with open('CRC32_LUT.csv','w') as csvfile:
-        outfile = csv.writer(csvfile, delimiter=',', quotechar='"', quoting=csv.QUOTE_MINIMAL)
-        i = 0
-        for dividend in range(256): # iterate over all possible input byte values 0 - 255
-            curByte = dividend << 24;
-            for bit in range(8):
-                if (curByte & 0x80000000) != 0:
-                    curByte <<= 1
-                    curByte ^=  polynomial
-                    curByte &= 0xFFFFFFFF
-                else:
-                    curByte <<= 1
-                    curByte &= 0xFFFFFFFF
-            
-            row.append(hex(curByte))
-            if ((dividend+1)%8 == 0):
-                outfile.writerow(row)
-                row = []
-                
-            CRC32_table[i] = curByte
-            i += 1
-            
-            
-        return CRC32_table
+    tables = [tuple(int(val) for val in table)]
+    for k in range(7):
+        tables.append(tuple(((val << 8) & 0xFFFFFFFF) ^ tables[0][val >> 24] for val in tables[-1]))
+    return tuple(tables)
+
+def calculate_CRC32_table(csv_file=None):
+    """
+    Get the lookup table to find the CRC-32 checksum of a number.
+    The table is built once when the module is imported
+    :param csv_file optionally also write the table to this CSV file as hex values, 8 per row
+    :return the table as a tuple of 256 ints
+    """
+    if csv_file != None:
+        write_table(csv_file, CRC32_TABLE, 8)
+    return CRC32_TABLE
 
 def crc8(p,polynomial=0x07,table=[]):
-	"""
-	Calculates the CRC-8 checksum of a number by bitwise operations or by
-	using a lookup table
-	:param p is the list of bytes to find the CRC of (list of ints)
-	:param polynomial the divisor polynomial to use
-	Default is 0x
-	:param table provide the lookup table to calculate CRC that way
-	Is faster with table but can also be done without
-	Leave unset to calculate using bitwise operations instead
-	:return the CRC-8 checksum as an int
-	"""
-    	if type(p) == int or type(p) == long:
-        	p = toBytesList(p)
-
-	#Initialize CRC to 0    
-	crc = 0
-	length = len(p)
-
-	if table == []:
-		for j in range(length):
-			crc ^= p[j] #move byte into MSB of 8bit CRC
-            		crc &= 0xFF
-
-			for i in range(8):
-				if (crc & 0x80) != 0: # test for MSB = bit 7
-					crc = ((crc << 1) ^ polynomial) & 0xFF
-				else:
-					crc <<= 1
-					crc &= 0xFF #Discard anything beyond 8 bits
-	else:
-		for i in range(length):
-			#XOR-in next input byte into MSB of crc and get this MSB, that's our new intermediate divident
-			pos = (crc ^ (p[i])) & 0xFF
-			#Update the CRC from the lookup table
-			crc = int(table[pos])
-	return crc & 0xFF
-
-def calculate_CRC8_table():
-    """
-    Generates a lookup table to find the CRC-8 checksum of a number
-    :return the table as a list of 256 ints
-    """
-    polynomial = 0x07
-    row = []
-    CRC8_table = np.zeros(256)
-    with open('CRC8_LUT.csv','w') as csvfile:
+        """
+        Calculates the CRC-8 checksum of a number by bitwise operations or by
+        using a lookup table
+        :param p is the bytes to find the CRC of (bytes, bytearray, memoryview, list of ints or an int)
+        :param polynomial the divisor polynomial to use
+        Default is 0x
+        :param table provide the lookup table to calculate CRC that way
+        Is faster with table but can also be done without
+        Leave unset to calculate using bitwise operations instead
+        :return the CRC-8 checksum as an int
+        """
+        if type(p) == int or type(p) == long:
+                p = toBytesList(p)
+        elif isinstance(p, (bytes, memoryview)):
+                p = bytearray(p) #Index to ints on Python 2 too
+
+        #Initialize CRC to 0    
+        crc = 0
+        length = len(p)
+
+        if len(table) == 0:
+                for j in range(length):
+                        crc ^= p[j] #move byte into MSB of 8bit CRC
+                        crc &= 0xFF
+
+                        for i in range(8):
+                                if (crc & 0x80) != 0: # test for MSB = bit 7
+                                        crc = ((crc << 1) ^ polynomial) & 0xFF
+                                else:
+                                        crc <<= 1
+                                        crc &= 0xFF #Discard anything beyond 8 bits
+        else:
+                for i in range(length):
+                        #XOR-in next input byte into MSB of crc and get this MSB, that's our new intermediate divident
+                        pos = (crc ^ (p[i])) & 0xFF
+                        #Update the CRC from the lookup table
+                        crc = table[pos]
+        return crc & 0xFF
+
+def crc8_batch(headers, checksums, table=None):
+    """
+    Check the CRC-8 checksums of many messages at once
+    :param headers (N, L) uint8 array with one message per row, e.g. the init byte and counter of N frame headers
+    :param checksums array of the N checksums to check against
+    :param table the CRC-8 lookup table. Default is CRC8_TABLE
+    :return boolean array which is True where the checksum matches
+    """
+    headers = np.asarray(headers, dtype=np.uint8)
+    table = np.asarray(CRC8_TABLE if table is None else table, dtype=np.uint8)
+    crc = np.zeros(len(headers), dtype=np.uint8)
+    for j in range(headers.shape[1]):
+        crc = table[crc ^ headers[:, j]]
+    return crc == np.asarray(checksums, dtype=np.uint8)
+
+def calculate_CRC8_table(csv_file=None):
+    """
+    Get the lookup table to find the CRC-8 checksum of a number.
+    The table is built once when the module is imported
+    :param csv_file optionally also write the table to this CSV file as hex values, 16 per row
+    :return the table as a tuple of 256 ints
+    """
+    if csv_file != None:
+        write_table(csv_file, CRC8_TABLE, 16)
+    return CRC8_TABLE
+
+def write_table(filename, table, per_row):
+    """
+    Write a lookup table to a CSV file as hex values
+    :param filename the file to write
+    :param table the lookup table
+    :param per_row the number of values per row
+    """
+    with open(filename, 'w') as csvfile:
         outfile = csv.writer(csvfile, delimiter=',', quotechar='"', quoting=csv.QUOTE_MINIMAL)
-        i = 0
-
-        for dividend in range(256):# iterate over all possible input byte values 0 - 255 */
-            curByte = dividend;
-            for bit in range(8):
-                if (curByte & 0x80) != 0:
-                    curByte <<= 1
-                    curByte ^= polynomial
-                    curByte &= 0xFF
-                else:
-                    curByte <<= 1
-                    curByte &= 0xFF
+        for i in range(0, len(table), per_row):
+            outfile.writerow([hex(val) for val in table[i:i + per_row]])
 
-            row.append(hex(curByte))
-            if ((dividend+1)%16 == 0):
-                outfile.writerow(row)
-                row = []
+def build_table(width, polynomial):
+    """
+    Compute the lookup table of an MSB-first CRC, one entry for each value of the next input byte
+    :param width the number of bits of the CRC (at least 8)
+    :param polynomial the divisor polynomial
+    :return the table as a tuple of 256 ints
+    """
+    top = 1 << (width - 1)
+    mask = (1 << width) - 1
+    table = []
+    for dividend in range(256): # iterate over all possible input byte values 0 - 255
+        curByte = dividend << (width - 8)
+        for bit in range(8):
+            if (curByte & top) != 0:
+                curByte = ((curByte << 1) ^ polynomial) & mask
+            else:
+                curByte = (curByte << 1) & mask
+        table.append(int(curByte))
+    return tuple(table)
 
-            CRC8_table[dividend] = curByte;
-    return CRC8_table
+#Lookup tables, built once per process
+CRC8_TABLE = build_table(8, 0x07)
+CRC32_TABLE = build_table(32, 0x04C11DB7)
+#The CRC-4 is computed as a CRC-8 with the polynomial in the top 4 bits
+CRC4_TABLE = tuple(val >> 4 for val in build_table(8, 0x3 << 4))
+CRC32_SLICE_TABLES = slice_tables(CRC32_TABLE)
@@ -0,0 +1,549 @@
+import numpy as np
+import sensor_output as out
+
+"""
+Vectorized decoding of blocks of sensor packets.
+Produces the same values as sensor_output, but for an (N, 53) array of packets at once,
+which makes offline reprocessing of long recordings practical
+"""
+
+PACKET_LENGTH = 53
+
+#Structure of one decoded packet
+PACKET_DTYPE = np.dtype([
+	('differential_raw', np.uint32, (6,)),
+	('sum_raw', np.uint32, (6,)),
+	('differential', np.float64, (6,)),
+	('sum', np.float64, (6,)),
+	('wrench', np.float64, (6,)),
+	('report_id', np.uint8),
+	('imu', np.float64, (4,)),
+	('temperature', np.float64),
+	('saturated', np.uint8, (6,)),
+	('checksum', np.uint32),
+	('byte', np.uint8, (53,)),
+	#Frame information, filled in by the reader that received the packet (see sensor_output)
+	('counter', np.int16),
+	('dropped', np.uint32),
+	('duplicate', np.bool_),
+	('index', np.int64),
+	('rx_time', np.float64),
+	('time', np.float64)
+	])
+
+#Structure of one packet kept as raw counts, half the size of PACKET_DTYPE without the packet bytes.
+#Scaling is only applied when converting to volts (see decode_raw and convert_raw)
+RAW_DTYPE = np.dtype([
+	('differential_counts', np.int32, (6,)), #Signed ADS counts
+	('sum_counts', np.int32, (6,)),
+	('report_id', np.uint8),
+	('imu_raw', np.uint16, (4,)),
+	('temperature_raw', np.uint16),
+	('checksum', np.uint32),
+	('counter', np.int16),
+	('dropped', np.uint32),
+	('duplicate', np.bool_),
+	('index', np.int64),
+	('rx_time', np.float64),
+	('time', np.float64)
+	])
+
+def imu_scale_table():
+	"""
+	:return (256, 4) array of the factor converting each of the 4 IMU words to a float, indexed by report ID.
+		Built from sensor_output.IMU_SCALES. Report IDs without a Q Point use 1, as sensor_output does
+	"""
+	table = np.ones((256, 4))
+	for report_id, scale in out.IMU_SCALES.items():
+		table[report_id] = scale
+	return table
+
+IMU_SCALE = imu_scale_table()
+
+def channel_params(sensor=None):
+	"""
+	Collect the per-channel ADC settings needed to convert the raw values to volts
+	:param sensor the Sensor object the packets came from. If None, the same defaults as sensor_output are used
+	:return G, vref, scale, offset, buf as arrays of 6 values (vref is a scalar). See sensor_output.ads_coefficients
+	"""
+	if sensor != None:
+		G = np.array(sensor.ads_gain, dtype=np.float64)
+		vref = sensor.vref
+		scale = np.array(sensor.ads_scale)
+		offset = np.array(sensor.ads_offset)
+		buf = np.array(sensor.ads_buffered, dtype=bool)
+	else:
+		G = np.ones(6)
+		vref = 2.5
+		scale = np.array(out.DEFAULT_SCALE)
+		offset = np.array(out.DEFAULT_OFFSET)
+		buf = np.ones(6, dtype=bool)
+	return G, vref, scale, offset, buf
+
+def to_uint24(block):
+	"""
+	Combine the trailing axis of an (..., 3) array of bytes, MSB first, into unsigned ints.
+	The bytes are copied into the top of 4 byte words, which are viewed as big-endian ints and shifted down
+	"""
+	words = np.zeros(block.shape[:-1] + (4,), dtype=np.uint8)
+	words[..., :3] = block
+	return words.view('>u4')[..., 0] >> 8
+
+def sign_extend24(raw):
+	"""
+	:param raw array of 24 bit two's complement values held in unsigned ints (see to_uint24)
+	:return int32 array of the signed values
+	"""
+	raw = raw.astype(np.int32)
+	return (raw ^ 0x800000) - 0x800000
+
+def to_uint16_lsb(block):
+	"""
+	Combine the trailing axis of an (..., 2) array of bytes, LSB first, into unsigned ints
+	"""
+	return np.ascontiguousarray(block).view('<u2')[..., 0].astype(np.uint32)
+
+def as_packets(packets):
+	"""
+	:param packets (N, 53) array of packets, or a bytes-like object holding N packets back to back
+	:return (N, 53) uint8 array
+	"""
+	if isinstance(packets, (bytes, bytearray, memoryview)):
+		packets = np.frombuffer(packets, dtype=np.uint8)
+	return np.asarray(packets, dtype=np.uint8).reshape(-1, PACKET_LENGTH)
+
+def decode_voltages(packets, vref, scale, offset):
+	"""
+	Convert the differential and sum values of a block of packets to volts
+	:param packets (N, 53) uint8 array
+	:param vref, scale, offset the conversion coefficients (see channel_params)
+	:return diff_raw, sum_raw, diff, sums as (N, 6) arrays
+	"""
+	#Convert all 6 values in differentials and sums to ints
+	raw = to_uint24(packets[:, :36].reshape(-1, 12, 3))
+	diff_raw = raw[:, :6]
+	sum_raw = raw[:, 6:]
+	diff, sums = counts_to_volts(sign_extend24(diff_raw), sum_raw, vref, scale, offset)
+	return diff_raw, sum_raw, diff, sums
+
+def counts_to_volts(diff_counts, sum_counts, vref, scale, offset):
+	"""
+	Convert signed differential counts and sum counts to volts
+	:param vref, scale, offset the conversion coefficients (see channel_params)
+	:return diff, sums as float64 arrays
+	"""
+	#Equation 4 (Pg. 34) of http://www.ti.com/lit/ds/symlink/ads1257.pdf
+	diff = diff_counts*scale + offset
+	sums = sum_counts * (vref / 2.0**12)
+	return diff, sums
+
+def saturation(diff, sums, gain, buf):
+	"""
+	Vectorized version of sensor_output.checkSaturation.
+	Based on table 7.3 (pg. 6) of:
+	http://www.ti.com/lit/ds/symlink/ads1257.pdf
+	:param diff (N, 6) array of differential voltages
+	:param sums (N, 6) array of sum voltages
+	:param gain the 6 PGA gains
+	:param buf the 6 input buffer settings (True if enabled)
+	:return (N, 6) uint8 array which is 1 where a channel is saturated
+	"""
+	buf = np.asarray(buf, dtype=bool)
+	#Check absolute input voltage. The inputs are Vbb - Vsum -/+ Vdiff/2, so only the lower one
+	#can be below the minimum and only the upper one above the maximum
+	Vbb = 4.775
+	mid = Vbb - sums
+	half = 0.5*np.abs(diff)
+	sat = mid - half < np.where(buf, 0, -0.1)
+	sat |= mid + half > np.where(buf, 3, 5.1)
+	#Check differential voltage
+	sat |= half > 2.5 / np.asarray(gain, dtype=np.float64)
+	#Check sum voltage
+	sat |= np.abs(sums) > 2.5
+	return sat.view(np.uint8)
+
+def decode_saturation(packets, sensor=None):
+	"""
+	Check a block of packets for saturation without decoding the rest of them
+	:param packets (N, 53) uint8 array of packets, or a bytes-like object holding N packets back to back
+	:param sensor the Sensor object the packets came from, used for the ADC settings
+	:return (N, 6) uint8 array which is 1 where a channel is saturated (see saturation())
+	"""
+	packets = as_packets(packets)
+	G, vref, scale, offset, buf = channel_params(sensor)
+	diff_raw, sum_raw, diff, sums = decode_voltages(packets, vref, scale, offset)
+	return saturation(diff, sums, G, buf)
+
+def raw_saturation(raw, sensor=None):
+	"""
+	Check packets already split into raw counts for saturation, without going back to the packet bytes
+	:param raw structured array with the fields of RAW_DTYPE (see decode_raw)
+	:param sensor the Sensor object the packets came from, used for the ADC settings
+	:return (N, 6) uint8 array which is 1 where a channel is saturated (see saturation())
+	"""
+	G, vref, scale, offset, buf = channel_params(sensor)
+	diff, sums = counts_to_volts(raw['differential_counts'], raw['sum_counts'], vref, scale, offset)
+	return saturation(diff, sums, G, buf)
+
+class saturation_monitor:
+	"""
+	Per-channel saturation counters of one continuous data session:
+
+	samples : number of samples checked
+	counts : number of saturated samples of each channel
+	longest : longest run of consecutive saturated samples of each channel
+	current : length of the run of each channel that is still going on at the last sample
+
+	Runs are tracked across calls to update(), so the stream can be checked one block at a time
+	"""
+	def __init__(self):
+		self.reset()
+
+	def reset(self):
+		self.samples = 0
+		self.counts = np.zeros(6, dtype=np.int64)
+		self.longest = np.zeros(6, dtype=np.int64)
+		self.current = np.zeros(6, dtype=np.int64)
+
+	def update(self, saturated):
+		"""
+		Count the saturated samples of the next block of the stream
+		:param saturated (N, 6) array which is nonzero where a channel is saturated (see saturation())
+		"""
+		sat = np.asarray(saturated).astype(bool).reshape(-1, 6)
+		n = len(sat)
+		if n == 0:
+			return
+		self.samples += n
+		self.counts += np.count_nonzero(sat, axis=0)
+		clear = ~sat
+		any_clear = clear.any(axis=0)
+
+		#Runs inside the block, found from where the mask switches on and off
+		edges = np.zeros((6, n + 2), dtype=np.int8)
+		edges[:, 1:-1] = sat.T
+		edges = np.diff(edges, axis=1)
+		channel, starts = np.nonzero(edges == 1)
+		ends = np.nonzero(edges == -1)[1]
+		np.maximum.at(self.longest, channel, ends - starts)
+
+		#The run at the start of the block continues the one at the end of the previous block
+		leading = np.where(any_clear, clear.argmax(axis=0), n)
+		trailing = np.where(any_clear, clear[::-1].argmax(axis=0), n)
+		np.maximum(self.longest, self.current + leading, out=self.longest)
+		self.current = np.where(any_clear, trailing, self.current + n)
+
+	def rate(self):
+		"""
+		:return the fraction of samples of each channel that were saturated
+		"""
+		return self.counts / float(self.samples) if self.samples > 0 else np.zeros(6)
+
+	def string(self):
+		"""
+		Print the counters in a useful manner
+		"""
+		print('Samples checked: ' + str(self.samples))
+		print('Saturated samples per channel: ' + str(self.counts.tolist()))
+		print('Longest saturated run per channel: ' + str(self.longest.tolist()))
+
+def decode_imu(packets):
+	"""
+	Parse the IMU section of a block of packets the same way sensor_output does
+	:param packets (N, 53) uint8 array
+	:return (N, 4) array of IMU values
+	"""
+	return imu_values(to_uint16_lsb(packets[:, 37:45].reshape(-1, 4, 2)), packets[:, 36])
+
+def imu_values(words, rid):
+	"""
+	Convert the raw IMU words of a block of packets to floats
+	:param words (N, 4) array of the unsigned 16 bit IMU words
+	:param rid array of the N report IDs
+	:return (N, 4) array of IMU values
+	"""
+	#Apply the Q Point of each packet's report ID, looked up for the whole block at once
+	imu = words * IMU_SCALE[rid]
+
+	#Normalise rotation vectors if need be
+	rot = is_rotation(rid)
+	mag = np.sqrt(np.einsum('ij,ij->i', imu, imu))
+	scale = rot & (mag > 1.1)
+	imu[scale] /= mag[scale, None]
+	return imu
+
+def is_rotation(report_id):
+	"""
+	:param report_id array of report IDs
+	:return boolean array which is True where the IMU values are unit quaternions (see ROTATION_IDS)
+	"""
+	return np.isin(report_id, ROTATION_IDS)
+
+def rotation_stack(block):
+	"""
+	Rotation matrices of all packets of a decoded block at once, e.g. for gravity compensation
+	:param block structured array with the fields of PACKET_DTYPE (see decode_packets)
+	:return rotations, valid where rotations is an (N, 3, 3) array and valid is True for the packets
+		that carry an orientation (Rotation Vector or Game Rotation Vector). The other matrices are NaN
+	"""
+	valid = is_rotation(block['report_id'])
+	rotations = np.full((len(block), 3, 3), np.nan)
+	rotations[valid] = quaternion_to_rotation(block['imu'][valid])
+	return rotations, valid
+
+def decode_packets(packets, sensor=None, calMatrix=None):
+	"""
+	Parse a block of 53 byte packets using the SH-2 structure
+	:param packets (N, 53) uint8 array of packets, or a bytes-like object holding N packets back to back
+	:param sensor the Sensor object the packets came from, used for the ADC settings
+		If None, the defaults of sensor_output are used
+	:param calMatrix the 6x6 calibration matrix. Defaults to sensor.calMatrix, or the identity if there is no sensor
+	:return structured array of length N with the fields of PACKET_DTYPE
+	"""
+	packets = as_packets(packets)
+	n = len(packets)
+	if calMatrix is None:
+		calMatrix = sensor.calMatrix if sensor != None else np.eye(6)
+	G, vref, scale, offset, buf = channel_params(sensor)
+
+	res = np.zeros(n, dtype=PACKET_DTYPE)
+	res['byte'] = packets
+	res['counter'] = -1
+
+	diff_raw, sum_raw, diff, sums = decode_voltages(packets, vref, scale, offset)
+	res['differential_raw'] = diff_raw
+	res['sum_raw'] = sum_raw
+	res['differential'] = diff
+	res['sum'] = sums
+
+	res['saturated'] = saturation(diff, sums, G, buf)
+
+	res['wrench'] = wrench(diff, sums, calMatrix)
+
+	res['report_id'] = packets[:, 36]
+	res['imu'] = decode_imu(packets)
+
+	#Parse Temperature Data
+	res['temperature'] = np.ascontiguousarray(packets[:, 47:49]).view('>u2')[:, 0] * 0.0625
+
+	#LSB comes last
+	res['checksum'] = np.ascontiguousarray(packets[:, 49:]).view('>u4')[:, 0]
+	return res
+
+def wrench(diff, sums, calMatrix):
+	"""
+	:param diff, sums (N, 6) arrays of differential and sum voltages
+	:param calMatrix the 6x6 calibration matrix
+	:return (N, 6) array of wrenches. Wrench is 0 for packets with any sum value equal to 0
+	"""
+	valid = np.all(sums != 0, axis=1)
+	ratio = np.zeros((len(diff), 6))
+	ratio[valid] = diff[valid] / sums[valid]
+	return np.dot(ratio, np.asarray(calMatrix, dtype=np.float64).T)
+
+def decode_raw(packets):
+	"""
+	Split a block of packets into raw integer fields, without converting anything to volts.
+	The 24 bit differential values are sign extended, all other fields are kept as sent
+	:param packets (N, 53) uint8 array of packets, or a bytes-like object holding N packets back to back
+	:return structured array of length N with the fields of RAW_DTYPE
+	"""
+	packets = as_packets(packets)
+	res = np.zeros(len(packets), dtype=RAW_DTYPE)
+	res['counter'] = -1
+	raw = to_uint24(packets[:, :36].reshape(-1, 12, 3))
+	res['differential_counts'] = sign_extend24(raw[:, :6])
+	res['sum_counts'] = raw[:, 6:]
+	res['report_id'] = packets[:, 36]
+	res['imu_raw'] = to_uint16_lsb(packets[:, 37:45].reshape(-1, 4, 2))
+	res['temperature_raw'] = np.ascontiguousarray(packets[:, 47:49]).view('>u2')[:, 0]
+	res['checksum'] = np.ascontiguousarray(packets[:, 49:]).view('>u4')[:, 0]
+	return res
+
+def convert_raw(raw, sensor=None, calMatrix=None):
+	"""
+	Decode packets stored as raw counts (see decode_raw), giving the same values as decode_packets
+	:param raw structured array with the fields of RAW_DTYPE
+	:param sensor the Sensor object the packets came from, used for the ADC settings
+		If None, the defaults of sensor_output are used
+	:param calMatrix the 6x6 calibration matrix. Defaults to sensor.calMatrix, or the identity if there is no sensor
+	:return structured array with the fields of PACKET_DTYPE. The packet bytes (byte) are not kept in raw and are left 0
+	"""
+	if calMatrix is None:
+		calMatrix = sensor.calMatrix if sensor != None else np.eye(6)
+	G, vref, scale, offset, buf = channel_params(sensor)
+	counts = raw['differential_counts']
+
+	res = np.zeros(len(raw), dtype=PACKET_DTYPE)
+	res['differential_raw'] = counts.view(np.uint32) & 0xFFFFFF
+	res['sum_raw'] = raw['sum_counts']
+	diff, sums = counts_to_volts(counts, raw['sum_counts'], vref, scale, offset)
+	res['differential'] = diff
+	res['sum'] = sums
+	res['saturated'] = saturation(diff, sums, G, buf)
+	res['wrench'] = wrench(diff, sums, calMatrix)
+	res['report_id'] = raw['report_id']
+	res['imu'] = imu_values(raw['imu_raw'].astype(np.uint32), raw['report_id'])
+	res['temperature'] = raw['temperature_raw'] * 0.0625
+	for name in ('checksum', 'counter', 'dropped', 'duplicate', 'index', 'rx_time', 'time'):
+		res[name] = raw[name]
+	return res
+
+def quaternion_to_rotation(q):
+	"""
+	Convert unit quaternions to rotation matrices, as sensor_output.quaternionToRotation
+	:param q (..., 4) array of quaternions in the order i, j, k, real
+	:return (..., 3, 3) array of rotation matrices
+	"""
+	q = np.asarray(q, dtype=np.float64)
+	qI, qJ, qK, qR = q[..., 0], q[..., 1], q[..., 2], q[..., 3]
+	rm = np.empty(q.shape[:-1] + (3, 3))
+	rm[..., 0, 0] = 1 - 2 * qJ**2 - 2 * qK**2
+	rm[..., 0, 1] = 2 * qI * qJ - 2 * qR * qK
+	rm[..., 0, 2] = 2 * qI * qK + 2 * qR * qJ
+	rm[..., 1, 0] = 2 * qI * qJ + 2 * qR * qK
+	rm[..., 1, 1] = 1 - 2 * qI**2 - 2 * qK**2
+	rm[..., 1, 2] = 2 * qJ * qK - 2 * qR * qI
+	rm[..., 2, 0] = 2 * qI * qK - 2 * qR * qJ
+	rm[..., 2, 1] = 2 * qJ * qK + 2 * qR * qI
+	rm[..., 2, 2] = 1 - 2 * qI**2 - 2 * qJ**2
+	return rm
+
+#Report IDs whose IMU values are unit quaternions
+ROTATION_IDS = (5, 8)
+REPORT_NAMES = out.REPORT_NAMES
+
+def _field(name):
+	return property(lambda self: self.block[name][self.row].tolist())
+
+class sample(object):
+	"""
+	Compact stand-in for sensor_output: one row of a structured array with the fields of PACKET_DTYPE.
+	It has the same attributes as sensor_output (returned as lists and numbers, like sensor_output),
+	but holds only a reference to the block and a row number. Derived values (quaternion, rotation matrix)
+	are computed on access. A sensor_output object takes several kB, a sample and its row under 400 bytes.
+	"""
+	__slots__ = ('block', 'row')
+
+	def __init__(self, block, row):
+		"""
+		:param block structured array with the fields of PACKET_DTYPE
+		:param row the index of the packet in block
+		"""
+		self.block = block
+		self.row = row
+
+	differential = _field('differential')
+	differential_raw = _field('differential_raw')
+	sum = _field('sum')
+	sum_raw = _field('sum_raw')
+	wrench = _field('wrench')
+	imu = _field('imu')
+	saturated = _field('saturated')
+	report_id = _field('report_id')
+	temperature = _field('temperature')
+	checksum = _field('checksum')
+	dropped = _field('dropped')
+	duplicate = _field('duplicate')
+	index = _field('index')
+	rx_time = _field('rx_time')
+	time = _field('time')
+
+	@property
+	def record(self):
+		"""
+		The row of the block itself (no copy)
+		"""
+		return self.block[self.row]
+
+	@property
+	def byte(self):
+		return bytearray(self.block['byte'][self.row].tobytes())
+
+	@property
+	def counter(self):
+		counter = int(self.block['counter'][self.row])
+		return None if counter < 0 else counter
+
+	@property
+	def report_id_str(self):
+		return REPORT_NAMES.get(self.report_id)
+
+	@property
+	def quaternion(self):
+		return self.imu if self.report_id in ROTATION_IDS else None
+
+	@property
+	def rotation(self):
+		if self.report_id not in ROTATION_IDS:
+			return None
+		return quaternion_to_rotation(self.block['imu'][self.row])
+
+	def isSaturated(self):
+		return bool(self.block['saturated'][self.row].any())
+
+	def failed(self):
+		return False
+
+	def to_array(self, detailed=False):
+		"""
+		Same as sensor_output.to_array
+		"""
+		if detailed:
+			return self.wrench + self.differential + self.sum + self.imu + [self.temperature]
+		else:
+			return self.wrench + self.imu + [self.temperature]
+
+class recording:
+	"""
+	Preallocated store of decoded packets for long captures. Rows are kept in one structured array
+	with the fields of PACKET_DTYPE, which grows by doubling, instead of as one sensor_output object per packet.
+	To use, append() decoded blocks (see decode_packets), then take array() or index it for sample objects
+	"""
+
+	def __init__(self, capacity=65536, dtype=PACKET_DTYPE):
+		"""
+		:param capacity the number of packets to allocate room for initially
+		:param dtype PACKET_DTYPE, or RAW_DTYPE to store raw counts (see decode_raw). Indexing a raw recording
+			gives its rows rather than sample objects
+		"""
+		self.data = np.zeros(capacity, dtype=dtype)
+		self.length = 0
+
+	def __len__(self):
+		return self.length
+
+	def __getitem__(self, i):
+		if i < 0:
+			i += self.length
+		if i < 0 or i >= self.length:
+			raise IndexError('recording index out of range')
+		return sample(self.data, i) if self.data.dtype == PACKET_DTYPE else self.data[i]
+
+	def __iter__(self):
+		for i in range(self.length):
+			yield self[i]
+
+	def append(self, block):
+		"""
+		Add decoded packets to the end of the recording
+		:param block structured array with the same fields as the recording
+		"""
+		n = len(block)
+		if self.length + n > len(self.data):
+			#Double the size, or more if the block does not fit even then (e.g. when starting from a capacity of 0)
+			size = max(2*len(self.data), self.length + n)
+			data = np.zeros(size, dtype=self.data.dtype)
+			data[:self.length] = self.data[:self.length]
+			self.data = data
+		self.data[self.length:self.length + n] = block
+		self.length += n
+
+	def array(self):
+		"""
+		:return the recorded packets as a structured array (a view, not a copy)
+		"""
+		return self.data[:self.length]
+
+	def clear(self):
+		self.length = 0
@@ -0,0 +1,266 @@
+import crc
+import timing
+import numpy as np
+
+INIT_BYTE = 0xAA
+HEADER_LENGTH = 3 #< Init byte > < 8-bit counter > < CRC8 >
+PACKET_LENGTH = 53 #< Byte 0 > ... < Byte 48 > < CRC32 >
+FRAME_LENGTH = HEADER_LENGTH + PACKET_LENGTH
+
+#Framing states
+SEARCHING = 0 #Alignment unknown, scanning for the next valid header
+LOCKED = 1 #The previous frame was valid, so the next one is expected right after it
+
+class link_stats:
+	"""
+	Counters describing the quality of one continuous data session:
+
+	frames : number of valid frames received
+	dropped : number of frames missing according to the frame counter
+	duplicated : number of frames that repeated the previous frame's counter
+	crc8_failures : number of expected headers (right after a valid frame) whose CRC8 did not match
+	crc32_failures : number of expected frames with a valid header whose CRC32 did not match
+	resyncs : number of times the alignment was lost and had to be searched for again
+	bytes_skipped : number of bytes discarded while searching for a valid frame
+	"""
+	def __init__(self):
+		self.reset()
+
+	def reset(self):
+		self.frames = 0
+		self.dropped = 0
+		self.duplicated = 0
+		self.crc8_failures = 0
+		self.crc32_failures = 0
+		self.resyncs = 0
+		self.bytes_skipped = 0
+
+	def loss_rate(self):
+		"""
+		:return the fraction of frames sent by the sensor that were not received
+		"""
+		sent = self.frames + self.dropped
+		return float(self.dropped) / sent if sent > 0 else 0.0
+
+	def string(self):
+		"""
+		Print the counters in a useful manner
+		"""
+		print('Frames received: ' + str(self.frames))
+		print('Dropped: ' + str(self.dropped) + ' (' + str(round(100*self.loss_rate(), 3)) + '%)')
+		print('Duplicated: ' + str(self.duplicated))
+		print('CRC-8 failures: ' + str(self.crc8_failures))
+		print('CRC-32 failures: ' + str(self.crc32_failures))
+		print('Resyncs: ' + str(self.resyncs) + ' (' + str(self.bytes_skipped) + ' bytes skipped)')
+
+class frame_sync:
+	"""
+	Bulk-read frame synchronizer for the continuous data stream.
+	Instead of reading the port one byte at a time to hunt for the initialization byte,
+	large chunks are pulled from the port into a reusable buffer, which is then scanned for
+	< 0xAA > < counter > < CRC8 > headers. Every complete 56 byte frame found in the buffer
+	whose CRC32 matches is returned, and any incomplete frame at the end is kept until the next chunk arrives.
+	The frame counter is tracked to detect dropped and duplicated frames (see link_stats).
+
+	Framing is a small state machine. While LOCKED, a frame is expected right after the previous one.
+	If that frame is not valid (header CRC8 or packet CRC32 failed), the framer falls back to SEARCHING
+	and scans the bytes it already buffered, starting one byte after the failed header, for the next
+	frame that passes both checks. No buffered bytes are thrown away, so a good frame that follows a
+	corrupted or truncated one is not lost.
+	To use, call read_frames() in a loop, or feed() data from another source and call frames()
+	"""
+
+	def __init__(self, port=None, crc8_table=None, crc32_table=None, chunk_size=4096, counter_modulus=256):
+		"""
+		:param port the ftdi device to read from. Can be None if data is supplied through feed()
+		:param crc8_table the CRC8 lookup table to check the headers with
+		:param crc32_table the CRC32 lookup table to check the packets with
+		:param chunk_size how many bytes to request from the port per read
+		:param counter_modulus the number of distinct values of the frame counter before it wraps around
+		"""
+		self.port = port
+		self.chunk_size = chunk_size
+		self.counter_modulus = counter_modulus
+		self.buf = bytearray()
+		self.start = 0 #Index of the first unprocessed byte in buf
+		self.state = SEARCHING
+		self.stats = link_stats()
+
+		if crc8_table is None:
+			crc8_table = crc.calculate_CRC8_table()
+		if crc32_table is None:
+			crc32_table = crc.calculate_CRC32_table()
+		self.crc32_tables = crc.slice_tables(crc32_table)
+		#The header CRC only depends on the counter, so precompute the expected CRC8 for each counter value
+		self.header_crc = bytearray([crc.crc8([INIT_BYTE, counter], table=crc8_table) for counter in range(256)])
+
+		#Counter state of the most recently returned frame
+		self.counter = None
+		self.dropped = 0
+		self.duplicate = False
+		self.index = -1 #Sample index: the number of frames sent by the sensor before this one
+		self.rx_time = None #Host time at which the last chunk of data was received
+
+	def feed(self, data, rx_time=None):
+		"""
+		Append received bytes to the buffer, discarding bytes that were already processed
+		:param data the bytes (or bytearray) to append
+		:param rx_time the host time at which data was received. Defaults to now (see timing.now)
+		"""
+		self.rx_time = timing.now() if rx_time == None else rx_time
+		if self.start > 0:
+			del self.buf[:self.start]
+			self.start = 0
+		self.buf += data
+
+	def __count(self, counter):
+		"""
+		Compare the counter of a new frame with the previous one to detect gaps and repeats.
+		Gaps of a multiple of counter_modulus frames cannot be detected
+		"""
+		self.dropped = 0
+		self.duplicate = False
+		if self.counter != None:
+			step = (counter - self.counter) % self.counter_modulus
+			if step == 0:
+				self.duplicate = True
+				self.stats.duplicated += 1
+			else:
+				self.dropped = step - 1
+				self.stats.dropped += step - 1
+			self.index += step
+		else:
+			self.index = 0
+		self.counter = counter
+		self.stats.frames += 1
+
+	def frames(self):
+		"""
+		Scan the buffered bytes for valid frames and yield the 53 byte packet of each one.
+		While a packet is being handled, counter, dropped, duplicate and index describe it,
+		and rx_time is the time at which its last bytes were received
+		:return generator of bytearrays containing the 53 bytes after each valid header
+		"""
+		buf = self.buf
+		stats = self.stats
+		header_crc = self.header_crc
+		end = len(buf) - FRAME_LENGTH
+		pos = self.start
+		while pos <= end:
+			#Check for initialization byte and test CRC8 checksum of initialization byte and counter
+			if buf[pos] == INIT_BYTE and buf[pos + 2] == header_crc[buf[pos + 1]]:
+				#Test CRC32 checksum of the packet in place. The checksum is sent MSB first
+				last = pos + FRAME_LENGTH
+				checksum = (buf[last - 4] << 24) | (buf[last - 3] << 16) | (buf[last - 2] << 8) | buf[last - 1]
+				if crc.crc32_slice8(buf, pos + HEADER_LENGTH, last - 4, self.crc32_tables) == checksum:
+					packet = buf[pos + HEADER_LENGTH:last]
+					self.state = LOCKED
+					self.__count(buf[pos + 1])
+					self.start = pos + FRAME_LENGTH
+					yield packet
+					pos = self.start
+					continue
+				elif self.state == LOCKED:
+					stats.crc32_failures += 1
+			elif self.state == LOCKED and buf[pos] == INIT_BYTE:
+				stats.crc8_failures += 1
+
+			#No valid frame here. Search the buffered bytes for the next initialization byte
+			if self.state == LOCKED:
+				self.state = SEARCHING
+				stats.resyncs += 1
+			nxt = buf.find(b'\xaa', pos + 1, end + 1)
+			if nxt == -1:
+				#Nothing left that could start a frame. Keep the last bytes in case a header was split
+				nxt = end + 1
+			stats.bytes_skipped += nxt - pos
+			pos = nxt
+		self.start = pos
+
+	def read_frames(self):
+		"""
+		Read one chunk from the port and return all complete frames that are now available
+		:return generator of 53 byte packets (see frames())
+		"""
+		self.feed(self.port.read(self.chunk_size))
+		return self.frames()
+
+	def frames_array(self):
+		"""
+		Collect all complete frames in the buffer into one block
+		:return (N, 53) uint8 array of packets, viewing a single contiguous copy of the packet bytes
+		"""
+		block = bytearray().join(self.frames())
+		return np.frombuffer(block, dtype=np.uint8).reshape(-1, PACKET_LENGTH)
+
+	def reset(self):
+		"""
+		Discard all buffered bytes and start a new session, e.g. after the port was purged
+		"""
+		self.buf = bytearray()
+		self.start = 0
+		self.state = SEARCHING
+		self.counter = None
+		self.dropped = 0
+		self.duplicate = False
+		self.index = -1
+		self.rx_time = None
+		self.stats.reset()
+
+def find_frames(raw, crc8_table=None, crc32_table=None):
+	"""
+	Find all valid frames in a raw capture of the continuous data stream at once, e.g. for offline replay.
+	Every initialization byte is a candidate frame start, and the checksums of all candidates are checked
+	together (see crc.crc8_batch and crc.crc32_batch) rather than frame by frame
+	:param raw the captured bytes (bytes-like or uint8 array)
+	:param crc8_table the CRC8 lookup table to check the headers with. Default is crc.CRC8_TABLE
+	:param crc32_table the CRC32 lookup table to check the packets with. Default is crc.CRC32_TABLE
+	:return packets, counters, starts where packets is an (N, 53) uint8 array of the packets of the valid frames,
+		counters the array of their frame counters and starts the index in raw at which each frame starts
+	"""
+	if isinstance(raw, (bytes, bytearray, memoryview)):
+		raw = np.frombuffer(raw, dtype=np.uint8)
+	raw = np.asarray(raw, dtype=np.uint8)
+	starts = np.flatnonzero(raw[:max(len(raw) - FRAME_LENGTH + 1, 0)] == INIT_BYTE)
+
+	#Check the headers first, which rules out almost all false starts
+	headers = raw[starts[:, None] + np.arange(HEADER_LENGTH)]
+	starts = starts[crc.crc8_batch(headers[:, :2], headers[:, 2], crc8_table)]
+
+	frames = raw[starts[:, None] + np.arange(FRAME_LENGTH)]
+	valid = crc.crc32_batch(frames[:, HEADER_LENGTH:FRAME_LENGTH - 4], frames[:, FRAME_LENGTH - 4:], crc32_table)
+	starts = starts[valid]
+	frames = frames[valid]
+
+	#A frame cannot start inside the previous one. A valid frame overlapping another is exceedingly unlikely, so drop it
+	keep = np.ones(len(starts), dtype=bool)
+	keep[1:] = np.diff(starts) >= FRAME_LENGTH
+	return frames[keep, HEADER_LENGTH:], frames[keep, 1], starts[keep]
+
+def count_gaps(counters, counter_modulus=256):
+	"""
+	Find dropped and duplicated frames in a recorded sequence of frame counters
+	:param counters array of the frame counters of consecutive received frames
+	:param counter_modulus the number of distinct values of the frame counter before it wraps around
+	:return dropped, duplicate where dropped[i] is the number of frames missing before frame i
+		and duplicate[i] is True if frame i repeated the counter of frame i-1
+	"""
+	counters = np.asarray(counters, dtype=np.int64)
+	step = np.zeros(len(counters), dtype=np.int64)
+	step[1:] = np.diff(counters) % counter_modulus
+	duplicate = np.zeros(len(counters), dtype=bool)
+	duplicate[1:] = step[1:] == 0
+	dropped = np.where(step > 0, step - 1, 0)
+	return dropped, duplicate
+
+def sample_index(counters, counter_modulus=256):
+	"""
+	Unwrap a recorded sequence of frame counters into sample indices, counting dropped frames
+	:param counters array of the frame counters of consecutive received frames
+	:param counter_modulus the number of distinct values of the frame counter before it wraps around
+	:return array where element i is the number of frames sent by the sensor between frame 0 and frame i
+	"""
+	dropped, duplicate = count_gaps(counters, counter_modulus)
+	step = np.where(duplicate, 0, dropped + 1)
+	step[:1] = 0
+	return np.cumsum(step)
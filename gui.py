@@ -465,7 +465,7 @@ class  ControlWidget(QWidget):
 	
 	def stop_data_transfer_wrapper(self):
 		if self.contiMode:
-			self.set_status(self.sensor.stop_data_transmission())
+			self.set_status('Stopped' if self.sensor.stop_data_transmission() else 'Failed to stop')
 			self.contiMode = False
 
 			self.plotThread.read = False
@@ -515,31 +515,23 @@ class  ControlWidget(QWidget):
 			self.update.emit(1,[count, int(s)],True)
 
 	def read_stuff(self):
-		string = ''
+		string = bytearray()
 		d = self.sensor.readBytes(1)
-		if d != []:
-				s = "%x" % d[0]
-				if len(s) < 2:
-					s = '0' + s
-				string += s
+		if d:
+				string += d
 		
 		count = 0
 		empty = 0
 		while count < 100000 and empty < 10:
-			if d == []:
+			if not d:
 				empty += 1
 			elif empty != 0:
 				empty = 0
 			d = self.sensor.readBytes(1)
-			if d != []:
-				s = "%x" % d[0]
-				if len(s) < 2:
-					s = '0' + s
-				string += s
-			else:
-				string += ''
+			if d:
+				string += d
 			count += 1
-		self.set_status(string.decode('hex'))
+		self.set_status(string.decode('latin-1'))
 		if count == 10000:
 			print('Failed to empty buffer. Read 10,000 bytes')
 
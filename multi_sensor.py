@@ -0,0 +1,224 @@
+import threading
+import time
+import pylibftdi as ftdi
+import numpy as np
+import timing
+from sensor import Sensor
+from acquisition import Acquisition
+import decoder
+
+class stream:
+	"""
+	Timestamped samples of one device, appended by its reader thread and taken by SensorGroup.read_aligned()
+	"""
+	def __init__(self, name, sensor=None):
+		self.name = name
+		self.sensor = sensor #None for ATI sensors
+		self.times = []
+		self.values = []
+		self.lock = threading.Lock()
+		self.thread = None
+		self.error = None #The exception that ended the reader thread, if any
+
+	def append(self, times, values):
+		with self.lock:
+			self.times.extend(times)
+			self.values.extend(values)
+
+class SensorGroup:
+	"""
+	Open several optical force sensors (and optionally ATI reference sensors) and stream them all at once.
+	Every device is read by its own thread. The samples of the optical force sensors are timestamped from their
+	frame counters (see timing.sample_clock) and the ATI sensors when they are read. read_aligned()
+	then matches the samples of every device to those of the first (reference) sensor by timestamp,
+	so recordings from different devices no longer have to be aligned offline.
+	The FTDI and comedi reads release the GIL while waiting, so one thread per device is enough.
+
+	To use:
+		group = SensorGroup([('USB-COM485 Plus2', 2), ('FT0NG8XX', 2)], ati={'FT24093': ati.Ati(path, 'FT24093', 1)})
+		group.start(1500)
+		for batch in group.batches(period=0.1, duration=60):
+			batch['time'], batch['USB-COM485 Plus2/2']['wrench'], batch['FT24093']
+		group.close()
+	"""
+
+	def __init__(self, devices, calMatrix=None, ati={}, ati_rate=1000):
+		"""
+		:param devices list of (deviceID, portNum) pairs of the optical force sensors to open.
+			deviceID is the serial number or description of the FTDI device, portNum its interface.
+			The samples of each sensor are named deviceID/portNum
+		:param calMatrix the 6x6 calibration matrix for all sensors, or a list of one per sensor. Defaults to the identity
+		:param ati dictionary of name: Ati object of the reference sensors to read alongside
+		:param ati_rate the sample rate in Hz at which the ATI sensors are read
+		"""
+		if calMatrix is None or np.ndim(calMatrix) == 2:
+			calMatrix = [np.eye(6) if calMatrix is None else calMatrix]*len(devices)
+
+		self.streams = []
+		self.acquisitions = []
+		for (deviceID, portNum), cal in zip(devices, calMatrix):
+			s = Sensor(cal, portNum=portNum, deviceID=deviceID)
+			self.streams.append(stream(deviceID + '/' + str(portNum), s))
+			self.acquisitions.append(Acquisition(s))
+		self.ati = ati
+		for name in ati:
+			self.streams.append(stream(name))
+
+		self.ati_rate = ati_rate
+		self.data_rate = 1500
+		self.stopping = threading.Event()
+
+	def start(self, data_rate=1500):
+		"""
+		Start continuous transmission of data on every sensor and start the reader threads
+		:param data_rate the sample rate in Hz (up to 16 bits) of the optical force sensors
+		:return True if all sensors were started
+		"""
+		self.data_rate = data_rate
+		self.stopping.clear()
+		started = True
+		for s in self.streams:
+			s.error = None
+		for s, acq in zip(self.streams, self.acquisitions):
+			started = acq.start(data_rate) and started
+			s.thread = threading.Thread(target=self.__read_sensor, args=(s, acq), name=s.name)
+		for s in self.streams[len(self.acquisitions):]:
+			s.thread = threading.Thread(target=self.__read_ati, args=(s, self.ati[s.name]), name=s.name)
+		for s in self.streams:
+			s.thread.daemon = True
+			s.thread.start()
+		return started
+
+	def stop(self):
+		"""
+		Stop the reader threads and continuous transmission of data on every sensor
+		"""
+		self.stopping.set()
+		for s in self.streams:
+			if s.thread != None:
+				s.thread.join()
+				s.thread = None
+		for s, acq in zip(self.streams, self.acquisitions):
+			if acq.running:
+				#A device whose port failed should not keep the others streaming
+				try:
+					acq.stop()
+				except ftdi._base.FtdiError as e:
+					print('Failed to stop ' + s.name + ': ' + str(e))
+
+	def close(self):
+		"""
+		Stop streaming and disconnect all sensors
+		"""
+		self.stop()
+		for acq in self.acquisitions:
+			acq.sensor.disconnect()
+
+	def __read_sensor(self, s, acq):
+		"""
+		Reader thread of one optical force sensor. If the port keeps failing, the error is kept in the stream (see read_aligned())
+		"""
+		try:
+			while not self.stopping.is_set():
+				times = []
+				packets = []
+				for packet in acq.read():
+					times.append(acq.frame()[5])
+					packets.append(packet)
+				if not packets:
+					#Nothing buffered yet. Yield the GIL instead of spinning on the port
+					time.sleep(0.0005)
+					continue
+				s.append(times, packets)
+		except ftdi._base.FtdiError as e:
+			print('Reading ' + s.name + ' failed: ' + str(e))
+			s.error = e
+
+	def __read_ati(self, s, ati):
+		"""
+		Reader thread of one ATI sensor, sampling it at ati_rate. If reading fails, the error is kept in the stream (see read_aligned())
+		"""
+		period = 1.0 / self.ati_rate
+		nxt = timing.now()
+		try:
+			while not self.stopping.is_set():
+				wrench = ati.read()
+				s.append([timing.now()], [wrench])
+				nxt += period
+				delay = nxt - timing.now()
+				if delay > 0:
+					time.sleep(delay)
+		except Exception as e:
+			print('Reading ' + s.name + ' failed: ' + str(e))
+			s.error = e
+
+	def read_aligned(self, tolerance=None):
+		"""
+		Take the samples received so far and align them on the timestamps of the first sensor.
+		Each reference sample is matched with the nearest sample of every other device. Reference samples newer than
+		the latest sample of any device are kept for the next call, as are samples that may still be matched
+		:param tolerance the largest time difference in seconds allowed between matched samples.
+			Reference samples without a match within tolerance on every device are dropped.
+			Defaults to one sample period of the slowest device
+		:return dictionary with 'time': array of the reference timestamps, and for each device name the matched samples,
+			as a structured array with the fields of decoder.PACKET_DTYPE for optical force sensors or an (N, 6) array for ATI sensors.
+			None if not every device has sent data yet.
+			Raises the error that stopped the reader thread of a device, since its samples can no longer be aligned
+		"""
+		for s in self.streams:
+			if s.error != None:
+				raise s.error
+		if tolerance == None:
+			tolerance = 1.0 / min([self.data_rate] + ([self.ati_rate] if self.ati else []))
+
+		for s in self.streams:
+			s.lock.acquire()
+		try:
+			if not all(s.times for s in self.streams):
+				return None
+			end = min(s.times[-1] for s in self.streams)
+			ref = self.streams[0]
+			k = int(np.searchsorted(ref.times, end, side='right'))
+			ref_t = np.array(ref.times[:k])
+			valid = np.ones(k, dtype=bool)
+			matches = [np.arange(k)]
+			for s in self.streams[1:]:
+				t = np.array(s.times)
+				#Nearest neighbour of each reference time
+				right = np.minimum(np.searchsorted(t, ref_t), len(t) - 1)
+				left = np.maximum(right - 1, 0)
+				idx = np.where(np.abs(ref_t - t[left]) <= np.abs(t[right] - ref_t), left, right)
+				valid &= np.abs(t[idx] - ref_t) <= tolerance
+				matches.append(idx)
+
+			res = {'time': ref_t[valid]}
+			for s, idx in zip(self.streams, matches):
+				values = [s.values[i] for i in idx[valid]]
+				if s.sensor != None:
+					res[s.name] = decoder.decode_packets(bytearray().join(values), s.sensor)
+				else:
+					res[s.name] = np.array(values).reshape(-1, 6)
+
+			#Keep the reference samples that were not used yet and the samples of the other devices that may still match them
+			del ref.times[:k], ref.values[:k]
+			for s, idx in zip(self.streams[1:], matches[1:]):
+				keep = int(idx[-1]) if k > 0 else 0
+				del s.times[:keep], s.values[:keep]
+			return res
+		finally:
+			for s in self.streams:
+				s.lock.release()
+
+	def batches(self, period=0.1, duration=None):
+		"""
+		Read aligned batches at a fixed interval until the deadline is reached
+		:param period seconds between batches
+		:param duration stop after this many seconds. None for no limit
+		:return generator of dictionaries (see read_aligned()). Raises the error of a device whose reader thread failed
+		"""
+		deadline = None if duration == None else time.time() + duration
+		while deadline == None or time.time() < deadline:
+			time.sleep(period)
+			batch = self.read_aligned()
+			if batch != None and len(batch['time']) > 0:
+				yield batch
@@ -0,0 +1,139 @@
+import re
+import collections
+import crc
+
+INIT_BYTE = 0xAA
+REGISTER_LENGTH = 8 #< 0xAA > < OFC (3 bytes) > < FSC (3 bytes) > < CRC8 >, registers LSB first
+REPORT_REGISTERS = 0x05 #Second byte of the command (0x31 to 0x36) asking an ADS for its calibration registers
+
+ACK = re.compile(b'([0-9A-Za-z_]+)-([0-9A-Za-z_]+)-([SF])') #< name >-< detail >-< S(ucceeded) or F(ailed) >
+ACK_TAIL = re.compile(b'[0-9A-Za-z_-]*\\Z') #Bytes at the end of the buffer that may begin an acknowledgement
+
+class ack:
+	"""
+	Acknowledgement sent by the sensor once a command has succeeded or failed, e.g. ADS-RST-S
+
+	text : the acknowledgement as a string
+	success : True if the command succeeded, False if it failed
+	command : the command it answers (list of bytes). None if no command was waiting for an acknowledgement
+	"""
+	def __init__(self, text, command=None):
+		self.text = text
+		self.success = text[-1] == 'S'
+		self.command = command
+
+class registers:
+	"""
+	Calibration registers reported by an ADS
+
+	ofc : offset calibration register (signed)
+	fsc : full-scale calibration register
+	command : the command that asked for them. None if no report was expected
+	ads_num : index of the ADS (0-5) that reported them. None if no report was expected
+	"""
+	def __init__(self, ofc, fsc, command=None):
+		self.ofc = ofc
+		self.fsc = fsc
+		self.command = command
+		self.ads_num = None if command == None else command[0] - 0x31
+
+class response_parser:
+	"""
+	Incremental decoder of the replies to commands.
+	The bytes received are split into acknowledgements and register reports as they arrive, without decoding
+	them to text, and each record is matched to the command it answers. The sensor handles commands in the order
+	they were sent, so the oldest command still waiting for an acknowledgement gets the next one, and the oldest
+	register request still waiting for its registers gets the next register report. Several commands can
+	therefore be in flight at once. Anything else (e.g. line breaks or a stray data frame) is skipped.
+	To use, call sent() for every command written, then feed() the received bytes and take the records(),
+	until done() is True
+	"""
+
+	def __init__(self, crc8_table=None):
+		"""
+		:param crc8_table the CRC8 lookup table to check the register reports with
+		"""
+		self.crc8_table = crc.calculate_CRC8_table() if crc8_table is None else crc8_table
+		self.buf = bytearray()
+		self.start = 0 #Index of the first unprocessed byte in buf
+		self.waiting = collections.deque() #Commands sent whose acknowledgement has not arrived, oldest first
+		self.reports = collections.deque() #Register requests sent whose registers have not arrived, oldest first
+		self.skipped = 0 #Bytes that were neither an acknowledgement nor a register report
+
+	def sent(self, command):
+		"""
+		Expect the reply to a command
+		:param command the command that was written to the sensor (list of bytes, without CRC8)
+		"""
+		self.waiting.append(command)
+		if 0x31 <= command[0] <= 0x36 and len(command) > 1 and command[1] == REPORT_REGISTERS:
+			self.reports.append(command)
+
+	def done(self):
+		"""
+		:return True once every command sent was acknowledged and every register request answered
+		"""
+		return not self.waiting and not self.reports
+
+	def feed(self, data):
+		"""
+		Append received bytes to the buffer, discarding bytes that were already processed
+		"""
+		if self.start > 0:
+			del self.buf[:self.start]
+			self.start = 0
+		self.buf += data
+
+	def records(self):
+		"""
+		Decode the buffered bytes. An acknowledgement or register report that is not complete yet is kept until more bytes arrive
+		:return generator of ack and registers records, in the order they were received
+		"""
+		buf = self.buf
+		pos = self.start
+		while True:
+			#An acknowledgement is text, so it cannot contain the initialization byte of a register report
+			nxt = buf.find(b'\xaa', pos)
+			match = ACK.search(buf, pos, len(buf) if nxt == -1 else nxt)
+			if match:
+				self.skipped += match.start() - pos
+				pos = self.start = match.end()
+				yield ack(match.group(0).decode('latin-1'), self.waiting.popleft() if self.waiting else None)
+				continue
+
+			if nxt == -1:
+				#Keep what may be the beginning of an acknowledgement
+				keep = ACK_TAIL.search(buf, pos).start()
+				self.skipped += keep - pos
+				pos = keep
+				break
+			self.skipped += nxt - pos
+			pos = nxt
+			complete = len(buf) - pos >= REGISTER_LENGTH
+			if not complete and not ACK.search(buf, pos + 1):
+				#Wait for the rest of the report
+				break
+			if not complete or crc.crc8(buf[pos:pos + REGISTER_LENGTH - 1], table=self.crc8_table) != buf[pos + REGISTER_LENGTH - 1]:
+				#Corrupted register report, or a stray initialization byte before an acknowledgement
+				self.skipped += 1
+				pos += 1
+				continue
+
+			ofc = buf[pos + 1] | (buf[pos + 2] << 8) | (buf[pos + 3] << 16)
+			#Find the 2's complement if ofc is negative
+			if ofc >= 2**23:
+				ofc -= 2**24
+			fsc = buf[pos + 4] | (buf[pos + 5] << 8) | (buf[pos + 6] << 16)
+			pos = self.start = pos + REGISTER_LENGTH
+			yield registers(ofc, fsc, self.reports.popleft() if self.reports else None)
+		self.start = pos
+
+	def reset(self):
+		"""
+		Discard all buffered bytes and forget the commands waiting for a reply, e.g. before new commands are sent
+		"""
+		self.buf = bytearray()
+		self.start = 0
+		self.waiting.clear()
+		self.reports.clear()
+		self.skipped = 0
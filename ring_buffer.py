@@ -0,0 +1,102 @@
+import threading
+import time
+
+class ring_buffer:
+	"""
+	Bounded buffer of decoded samples shared between the read thread (single producer)
+	and any number of consumers. The producer never waits: when the buffer is full,
+	the oldest sample is overwritten and counted in overwritten. Consumers can take
+	one sample at a time, blocking with a timeout, or drain many samples at once.
+	Each sample is handed to exactly one consumer.
+	"""
+
+	def __init__(self, capacity=8192):
+		"""
+		:param capacity the number of samples the buffer holds before it starts overwriting
+		"""
+		self.capacity = capacity
+		self.slots = [None]*capacity
+		self.head = 0 #Total number of samples written
+		self.tail = 0 #Total number of samples read or overwritten
+		self.written = 0
+		self.overwritten = 0
+		self.cond = threading.Condition(threading.Lock())
+
+	def __len__(self):
+		return self.head - self.tail
+
+	def put(self, item):
+		"""
+		Add a sample, overwriting the oldest one if the buffer is full
+		:param item the sample to add
+		"""
+		with self.cond:
+			if self.head - self.tail == self.capacity:
+				self.tail += 1
+				self.overwritten += 1
+			self.slots[self.head % self.capacity] = item
+			self.head += 1
+			self.written += 1
+			self.cond.notify()
+
+	def __wait(self, timeout):
+		"""
+		Wait until at least one sample is available. Must be called with cond held
+		:param timeout seconds to wait. None waits forever, 0 does not wait
+		:return True if a sample is available
+		"""
+		if timeout is None:
+			while self.head == self.tail:
+				self.cond.wait()
+			return True
+		deadline = time.time() + timeout
+		while self.head == self.tail:
+			remaining = deadline - time.time()
+			if remaining <= 0:
+				return False
+			self.cond.wait(remaining)
+		return True
+
+	def read(self, timeout=None):
+		"""
+		Take the oldest sample from the buffer
+		:param timeout seconds to wait for a sample. None waits forever, 0 does not wait
+		:return the sample, or None if none arrived before the timeout
+		"""
+		with self.cond:
+			if not self.__wait(timeout):
+				return None
+			idx = self.tail % self.capacity
+			item = self.slots[idx]
+			self.slots[idx] = None
+			self.tail += 1
+			return item
+
+	def read_many(self, n=None, timeout=0):
+		"""
+		Drain up to n samples at once, oldest first
+		:param n the maximum number of samples to take. None takes everything that is buffered
+		:param timeout seconds to wait for the first sample. None waits forever, 0 does not wait
+		:return list of samples (empty if none arrived before the timeout)
+		"""
+		with self.cond:
+			if not self.__wait(timeout):
+				return []
+			count = self.head - self.tail
+			if n is not None:
+				count = min(count, n)
+			items = []
+			for i in range(self.tail, self.tail + count):
+				idx = i % self.capacity
+				items.append(self.slots[idx])
+				self.slots[idx] = None
+			self.tail += count
+			return items
+
+	def clear(self):
+		"""
+		Discard all buffered samples
+		"""
+		with self.cond:
+			self.slots = [None]*self.capacity
+			self.tail = self.head
@@ -2,18 +2,40 @@ import numpy as np
 import sensor_output as out
 import pylibftdi as ftdi
 import crc
+import framing
+import timing
+import ring_buffer
+import response
 import threading
 import time
 import codecs
 import struct
 import os
+import json
 import signal
 from PyQt5 import QtCore
-import re
+
+try:
+	unicode
+except NameError: #Python 3 has no separate unicode type
+	unicode = str
 
 
 INIT_BYTE = 0xAA
 BYTES_PER_DIGIT_IN = 1
+COMMAND_TIMEOUT = 1.0 #Seconds to wait for the response to a command
+RESPONSE_CHUNK = 4096 #How many bytes to request from the port per read while waiting for a response
+STOP_TIMEOUT = 1.0 #Seconds to wait for the data stream to stop
+STOP_QUIET = 0.005 #Seconds without new bytes after which the data stream is considered stopped
+STOP_RETRY = 0.1 #Seconds after which the stop command is sent again if data still arrives
+ADS_DEFAULT_GAIN = 1 #PGA gain of an ADS after power-on or a reset
+ADS_DEFAULT_RATE = 30e3 #Data rate of an ADS after power-on or a reset
+ADS_DEFAULT_BUFFER = False #Input buffer of an ADS after power-on or a reset
+ADS_RESET_TIME = 0.7 #Seconds the ADS needs after a reset before its calibration registers are valid
+ADS_CALIBRATION_TIME = 0.2 #Seconds the ADS needs to calibrate after a self-calibration, or a setting change with ACAL enabled
+ADS_CALIBRATION_PERIODS = 4 #Conversion periods the calibration takes at low data rates, if that is longer than ADS_CALIBRATION_TIME
+UNKNOWN_SETTINGS = ('adsAcal', 'adsChannel', 'dacCurrent') #Settings that are marked unknown (None) if their command was not acknowledged
+CONFIG_FILE = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'sensor_config.json') #Saved configurations (see Sensor.save_config)
 """
 Implementation of sensor class using ftd2xx instead of pyftdi.serialext.
 This is probably the best because the latency timer can be set programmatically
@@ -21,23 +43,19 @@ To use, initialzie a sensor object, send commands and receive sensor output by c
 the functions below
 """
 
-data_stream = None
 class Sensor:
 	
-	def __init__(self, calMatrix, portNum=2, quick=False):
+	def __init__(self, calMatrix, portNum=2, quick=False, deviceID='USB-COM485 Plus2', restore=False):
 		"""
 		Opens a connection to a serial device and creates a serial object with which to control it
 		:param portNum Index of port of device to open. Default value is 1, but 2 is also common
+		:param deviceID the serial number or description of the FTDI device to open
+		:param restore if True, take the configuration saved for this sensor with save_config() instead of reading
+			the calibration registers. Only use this if the sensor was not power cycled or reconfigured since it was saved
 		"""
 
 		#Dictionary of report IDs
-		self.rep_ids = {
-			1: 'Accelerometer',
-			2: 'Gyroscope',
-			4: 'Linear Acceleration',
-			5: 'Rotation Vector',
-			8: 'Game Rotation Vector'
-			}
+		self.rep_ids = out.REPORT_NAMES
 
 		self.ab = {
 			2.5:(0x5DC000,2.7304),
@@ -63,27 +81,37 @@ class Sensor:
 		self.calMatrix = calMatrix
 
 		self.num_errors = 0
-		self.port = ftdi.Device('USB-COM485 Plus2', interface_select=portNum)
+		self.deviceID = deviceID
+		self.portNum = portNum
+		self.port = ftdi.Device(deviceID, interface_select=portNum)
 		self.port.ftdi_fn.ftdi_set_latency_timer(1)
 		self.port.ftdi_fn.ftdi_set_line_property(8,1,0)
 		self.port.baudrate = 3000000
 
 		self.threadLock = threading.Lock()
+		self.poll_framer = framing.frame_sync(None, self.crc8_table, self.crc32_table) #Finds the packet answering poll()
+		self.responses = response.response_parser(self.crc8_table) #Splits the replies to other commands into records
+		self.buffer = ring_buffer.ring_buffer()
 		self.thread = read_thread(parent=self, port=self.port, threadLock=self.threadLock)
 		self.block = False
+		self.eager = () #Fields of sensor_output decoded as soon as a packet is parsed (see sensor_output)
 
-		self.inBuf = [False]*6
+		#Shadow copy of the device configuration, as set by this object. None where the setting is not known
+		self.inBuf = [ADS_DEFAULT_BUFFER]*6
 		self.data_rate = 1500
-		self.adsGain = [1]*6
-		self.adsRate = [30e3]*6
+		self.adsGain = [ADS_DEFAULT_GAIN]*6
+		self.adsRate = [ADS_DEFAULT_RATE]*6
+		self.adsAcal = [None]*6 #Auto-calibration enabled in the root registers
+		self.adsChannel = [[None, None] for i in range(6)] #Positive and negative input of each ADS
+		self.dacCurrent = [None]*6 #LED current of each DAC channel in mA
 		self.vref = 2.5
 		self.OFC = [1]*6
 		self.FSC = [1]*6
-		if not quick:
-			for i in range(6):
-				o,f = self.ads_report_registers(i)
+		if not quick and not (restore and self.load_config()):
+			for i, (o,f) in enumerate(self.__read_registers(range(6))):
 				self.OFC[i] = o
 				self.FSC[i] = f
+		self.update_ads_coefficients()
 
 	#Close session
 	def __del__(self):
@@ -96,39 +124,45 @@ class Sensor:
 	def disconnect(self):
 		self.port.close()
 
-	def read(self, timeout=10000):
+	def read(self, timeout=1.0):
 		"""
-		Read and parse 53 bytes from the continuous data stream.
+		Take the oldest parsed packet from the continuous data stream.
 		This should be called in a loop after calling start_data_transmission()
+		:param timeout how many seconds to wait for a packet before giving up
 		:return sensor_output object of the data
-			returns Empty sensor_output if it was unable to read 53 bytes from the stream
+			returns Empty sensor_output if no packet arrived before the timeout
 		"""
-		global data_stream
-
-		#Wait until timeout for data
-		count = 0
-		while data_stream == None and count < timeout:
-			count += 1
-
-		if count == timeout:
+		data = self.buffer.read(timeout)
+		if data == None:
 			print('Error: Error reading from stream (No data)')
 			return out.sensor_output()
-		else:
-			self.threadLock.acquire()
-			data = data_stream
-			data_stream = None #Get rid of the old measurement
-			self.threadLock.release()
 		return data
 
+	def read_many(self, n=None, timeout=0):
+		"""
+		Take all packets received since the last call (or up to n of them) from the continuous data stream
+		:param n the maximum number of packets to return. None returns all buffered packets
+		:param timeout how many seconds to wait for at least one packet. 0 returns immediately
+		:return list of sensor_output objects, oldest first
+		"""
+		return self.buffer.read_many(n, timeout)
+
 	def write(self, byte):
 		try:
 			n = self.port.write(byte)
-			print('Sent ' + str(n) + ' bytes (' + codecs.encode(byte,'hex') + ')')
+			print('Sent ' + str(n) + ' bytes (' + codecs.encode(byte,'hex').decode('latin-1') + ')')
 		except ftdi._base.FtdiError:
 			print("Failed to write. USB bulk write error.")
 
 	####### Functions of the sensor  #######
 	###  Measurements  ###
+	def stream_stats(self):
+		"""
+		:return link_stats of the current (or last) continuous data session, counting
+			received, dropped and duplicated frames as well as CRC failures
+		"""
+		return self.thread.framer.stats
+
 	def start_data_transmission(self, data_rate=1500):
 		"""
 		Start continuous transmission of data from the sensor by starting a thread
@@ -137,6 +171,7 @@ class Sensor:
 		if self.block:
 			print('Failed. In continuous data mode already. Call stop_data_transmission() first.')
 			return
+		self.data_rate = data_rate
 		data_rate = self.toHex(data_rate)
 		while len(data_rate) < 4:
 			data_rate = '0' + data_rate
@@ -148,48 +183,68 @@ class Sensor:
 		print('Starting data transmission at ' + str(int(data_rate,16)) + 'Hz')
 		self.port.write(self.toStr([0x10, byte1, byte2], with_crc8=True))
 		self.block = True
+		self.buffer.clear()
+		self.thread.exitFlag = False
 		self.thread.start()
 
 	def stop_data_transmission(self):
 		"""
 		Stop continuous transmission of data from the sensor by ending the thread
-		and clearing all associated buffers to avoid receiving extra data after the fact.
-		The data stream remains untouched.
+		and draining the receive buffer to avoid receiving extra data after the fact.
+		The packets already in the ring buffer remain untouched. The thread is kept and started again by start_data_transmission()
+		:return True if the sensor stopped sending
 		"""
-
-		# Tell device to stop
 		self.block = False
-		
-		self.thread.exitFlag = True #End the thread
-		# if self.thread.is_alive():	
-		# 	self.thread.join()
-		if self.thread.isRunning():
-			self.thread.quit()
-			time.sleep(0.5)
-			if self.thread.isRunning():
-				print("Error. Read thread still running")
-
-		self.__do([0x11, 0x00, 0x00],regex='\w+-\w+-[SF]',verbose=False)
-		count = 1
-		while count < 100 and self.readBytes(1) != []:
-			self.__do([0x11,0x00,0x00], verbose=False,regex='\w+-\w+-[SF]')
-			self.purge_rx()
-			count += 1
-		if count == 100:
-			print('Failed to stop. Still sending data.')
 
-		self.purge(verbose=True)
+		#End the thread before draining, so the two do not both read the port
+		self.thread.exitFlag = True
+		if not self.thread.wait(int(1000*STOP_TIMEOUT)):
+			print("Error. Read thread still running")
 
-		#Destroy the thread and create a new one so it can be started again
-		del self.thread
-		self.thread = read_thread(parent=self, port=self.port, threadLock=self.threadLock)
+		#Like a new thread, the thread starts again without subscribers
+		try:
+			self.thread.data_source.disconnect()
+		except TypeError:
+			pass #None connected
+
+		return self.stop_stream()
+
+	def stop_stream(self, timeout=STOP_TIMEOUT):
+		"""
+		Send the command that stops continuous transmission and discard everything the sensor sends until the line is quiet.
+		The command is only sent again if data still arrives STOP_RETRY seconds after it, in case it was lost
+		:param timeout how many seconds to keep trying before giving up
+		:return True if the sensor stopped sending
+		"""
+		stop = self.toStr([0x11, 0x00, 0x00], with_crc8=True)
+		#A slow stream is only over once no frame arrived for a few sample periods
+		quiet = max(STOP_QUIET, 3.0 / max(self.data_rate, 1))
+		self.port.write(stop)
+		now = timing.now()
+		sent = last = now
+		deadline = now + timeout + quiet
+		while now < deadline:
+			data = self.port.read(RESPONSE_CHUNK)
+			now = timing.now()
+			if data:
+				last = now
+				if now - sent > STOP_RETRY:
+					self.port.write(stop)
+					sent = now
+			elif now - last > quiet:
+				return True
+			else:
+				#Yield the GIL instead of spinning on the port
+				time.sleep(0.0002)
+		print('Failed to stop. Still sending data.')
+		return False
 
 	def poll(self):
 		#Take one measurement and parse it
 		if self.block:
 			print('Failed. In continuous data mode. Call stop_data_transmission() first.')
 			return
-		dat = self.__do([0x12, 0x00, 0x00, 0x74],verbose=False,expect_package=True,with_crc8=False,fast=True)
+		dat = self.__do([0x12, 0x00, 0x00, 0x74],verbose=False,expect_package=True,with_crc8=False)
 		if dat != None:
 			# dat.string(detailed=True)
 			return dat
@@ -199,22 +254,39 @@ class Sensor:
 	###  Reset and Deactivation  ###
 
 	def reset_device(self):
-		#Reset the device
-		return self.__do([0xF0, 0x00, 0x00],regex='\w+-\w+-[SF]')
+		"""
+		Reset the whole device, then read the calibration registers the ADSs find after the reset
+		"""
+		if self.block:
+			print('Failed. In continuous data mode. Call stop_data_transmission() first.')
+			return
+		for i in range(6):
+			self.__forget_ads(i)
+		self.dacCurrent = [None]*6
+		resp = self.__do([0xF0, 0x00, 0x00])
+		time.sleep(ADS_RESET_TIME)
+		for i, (o,f) in enumerate(self.__read_registers(range(6))):
+			if o==2**25 or f==2**25:
+				print('Updating calibration constants failed. Please Retry')
+			else:
+				self.OFC[i] = o
+				self.FSC[i] = f
+		self.update_ads_coefficients()
+		return resp
 	
 	def reset_imu(self):
 		#Reset the IMU
 		if self.block:
 			print('Failed. In continuous data mode. Call stop_data_transmission() first.')
 			return
-		return self.__do([0xFA, 0x00, 0x00],regex='\w+-\w+-[SF]')
+		return self.__do([0xFA, 0x00, 0x00])
 	
 	def reset_dac(self):
 		#Reset the DAC
 		if self.block:
 			print('Failed. In continuous data mode. Call stop_data_transmission() first.')
 			return
-		return self.__do([0xFB, 0x00, 0x00],regex='\w+-\w+-[SF]')
+		return self.__do([0xFB, 0x00, 0x00])
 	
 	def reset_ads(self, ads_num):
 		"""
@@ -225,22 +297,44 @@ class Sensor:
 			print('Failed. In continuous data mode. Call stop_data_transmission() first.')
 			return
 		if ads_num <= 5 and ads_num >= 0: 
-			resp = self.__do([0xF0 + ads_num + 1, 0x00, 0x00],regex='\w+-\w+-[SF]')
-			time.sleep(0.7)
-			o,f = self.ads_report_registers(ads_num)
-			if 2**17 == o or 2**17 == f:
-				print('Updating calibration constants failed. Please Retry')
-			else:
-				self.OFC[ads_num] = o
-				self.FSC[ads_num] = f
-			return resp + 'ADS' + str(ads_num+1) + ' recalibrated successfully'
+			self.__forget_ads(ads_num)
+			resp = self.__do([0xF0 + ads_num + 1, 0x00, 0x00])
+			time.sleep(ADS_RESET_TIME)
+			return resp + self.__reload_registers(ads_num)
 		elif ads_num == -1:
-			resp = ''
+			#Reset all of them first so that they calibrate at the same time
 			for i in range(6):
-				resp+=self.reset_ads(i)
+				self.__forget_ads(i)
+			resp = self.__do_many([[0xF0 + i + 1, 0x00, 0x00] for i in range(6)])
+			time.sleep(ADS_RESET_TIME)
+			for i in range(6):
+				resp += self.__reload_registers(i)
 			return resp
 		else: 
 			print('Invalid index')
+
+	def __reload_registers(self, ads_num):
+		"""
+		Read the calibration registers of an ADS after it was reset and update the conversion coefficients
+		"""
+		o,f = self.ads_report_registers(ads_num)
+		if 2**25 == o or 2**25 == f:
+			print('Updating calibration constants failed. Please Retry')
+		else:
+			self.OFC[ads_num] = o
+			self.FSC[ads_num] = f
+		self.update_ads_coefficients()
+		return 'ADS' + str(ads_num+1) + ' recalibrated successfully'
+
+	def __forget_ads(self, ads_num):
+		"""
+		Return the settings of an ADS to what a reset sets them to. Those that are not known are marked unknown
+		"""
+		self.adsGain[ads_num] = ADS_DEFAULT_GAIN
+		self.adsRate[ads_num] = ADS_DEFAULT_RATE
+		self.inBuf[ads_num] = ADS_DEFAULT_BUFFER
+		self.adsAcal[ads_num] = None
+		self.adsChannel[ads_num] = [None, None]
 	
 	def deactivate_ads(self, ads_num):
 		"""
@@ -251,12 +345,9 @@ class Sensor:
 			print('Failed. In continuous data mode. Call stop_data_transmission() first.')
 			return
 		if ads_num == -1:
-			resp = ''
-			for i in range(6):
-				resp += self.__do([0xE0 + i+1, 0x00, 0x00],regex='\w+-\w+-[SF]')
-			return resp
+			return self.__do_many([[0xE0 + i+1, 0x00, 0x00] for i in range(6)])
 		if ads_num < 5 and ads_num >= 0: 
-			return self.__do([0xE0 + ads_num+1, 0x00, 0x00],regex='\w+-\w+-[SF]')
+			return self.__do([0xE0 + ads_num+1, 0x00, 0x00])
 		else: 
 			print('Invalid index')
 
@@ -306,7 +397,7 @@ class Sensor:
 			byte = [0x20 + mode ,delay1, delay2]
 		else:
 			return
-		return self.__do(byte,regex='\w+-\w+-[SF]')
+		return self.__do(byte)
 
 	def set_imu_accelerometer(self, delay):
 		return self.config_imu(1, delay)
@@ -321,22 +412,22 @@ class Sensor:
 		return self.config_imu(5, delay)
 
 	def set_imu_game_rot(self, delay):
-		return self.config_iu(8, delay)
+		return self.config_imu(8, delay)
 
 	def imu_start_calibration(self):
-		self.__do([0x2F, 0x01, 0x00],regex='\w+-\w+-[SF]')
+		self.__do([0x2F, 0x01, 0x00])
 
 	def imu_cancel_calibration(self):
 		"""
 		Stop the calibration without saving it
 		"""
-		self.__do([0x2F, 0x03, 0x00],regex='\w+-\w+-[SF]')
+		self.__do([0x2F, 0x03, 0x00])
 
 	def imu_finish_calibration(self):
 		"""
 		Complete the IMU calibration, saving the Dynamic Calibration Data (DCD0 to the IMU)
 		"""
-		self.__do([0x2F, 0x02, 0x00],regex='\w+-\w+-[SF]')
+		self.__do([0x2F, 0x02, 0x00])
 
 	def parse_calibration_state(self):
 		"""
@@ -350,12 +441,7 @@ class Sensor:
 				3		Accuracy High 
 		"""
 		dat = self.readLine(startChar='G', startChar2='M')
-
-		datStr = ''
-		for num in dat:
-			datStr += self.toHex(num, padded=True)
-
-		datStr = datStr.decode('hex')
+		datStr = dat.decode('latin-1')
 
 		idx = datStr.find(':')
 
@@ -407,88 +493,216 @@ class Sensor:
 		if ads_num not in [-1,0,1,2,3,4,5]:
 			print('Invalid ads number. Values between 1 and 6 are permitted, or -1 to select all')
 			return
-		if ads_num == -1:
-			resp = ''
-			for i in range(6):
-				resp += self.__config_ads(i,category,setting)
-			return resp
-		else:
-			#Set the first byte
-			byte = [0x30 + ads_num+1] 
-			resp = []
-			#Select which category to work with
-			cat_dict = {'root' : 0, 'drate' : 1, 'pga' : 2, 'pos' : 3, 'neg' : 4}
-			if type(category) == str: #Convert string inputs
-				category = cat_dict.get(category.lower(), value=-1)
-			if category < 0 or category > 6: #Check validity
-				print('Invalid Category String')
+		#With ads_num -1 the commands for all six are sent back to back (see config_transaction)
+		t = self.transaction()
+		if not t.ads(ads_num, category, setting):
+			return
+		return t.commit()
+
+	def ads_command(self, ads_num, category, setting, settings=None):
+		"""
+		Build the command that configures one ADS (see __config_ads) without sending it
+		:param ads_num the index of the ads (0-5)
+		:param settings list to which the (name, index, value) of every setting of this object the command changes is appended.
+			They are only recorded once the command is acknowledged (see commit)
+		:return the command as a list of bytes, or None if the category or setting is invalid
+		"""
+		if settings == None:
+			settings = []
+		#Set the first byte
+		byte = [0x30 + ads_num+1] 
+		#Select which category to work with
+		cat_dict = {'root' : 0, 'drate' : 1, 'pga' : 2, 'pos' : 3, 'neg' : 4}
+		if type(category) == str: #Convert string inputs
+			category = cat_dict.get(category.lower(), -1)
+		if category < 0 or category > 6: #Check validity
+			print('Invalid Category String')
+			return
+
+		if category == 0: #Configure Root Registers
+			if (type(setting) != tuple and type(setting) != str) or len(setting) != 2 or setting[0] not in [0,1] or setting[1] not in [0,1]:
+				print('Invalid setting. Please enter a tuple or string with 2 binary elements to configure root registers')
+				return
+			settings.append(('inBuf', ads_num, setting[1]==1))
+			settings.append(('adsAcal', ads_num, setting[0]==1))
+			config = int(str(setting[0]) + str(setting[1]) + '000000',2)
+			byte.append(0x00)
+			byte.append(config)
+
+		elif category == 1: #Configure Data Rate
+			rates = np.array([2.5, 5, 10, 15, 25, 30, 50, 60, 100, 500, 1e3, 2e3, 3.75e3, 7.5e3, 15e3, 30e3])
+			#Ensure we have an acceptable value
+			if setting not in rates:
+				diff = np.abs(rates - setting)
+				setting = rates[np.argmin(diff)]
+				print('Data rate value not permitted. Rounding to ' + str(setting))
+
+			settings.append(('adsRate', ads_num, setting))
+
+			config = np.where(rates == setting)[0][0]
+			byte.append(0x01)
+			byte.append(config)
+
+		elif category == 2: #Configure PGA Gain
+			gains = np.array([1, 2, 4, 8, 16, 32, 64])
+			
+			if setting not in gains:
+				diff = np.abs(gains - setting)
+				setting = gains[np.argmin(diff)]
+				print('Gain value not permitted. Rounding to ' + str(setting))
+
+			settings.append(('adsGain', ads_num, setting))
+
+			config = np.where(gains == setting)[0][0]
+			byte.append(0x02)
+			byte.append(config)
+
+		elif category == 3: #Configure Positive Channel
+			if setting not in [0,1,2,3]:
+				print('Please enter a channel between 0 and 3 (inclusive)')
 				return
+			settings.append(('adsChannel', (ads_num, 0), setting))
+			byte.append(0x03)
+			byte.append(setting)
 
-			if category == 0: #Configure Root Registers
-				if (type(setting) != tuple and type(setting) != str) or len(setting) != 2 or setting[0] not in [0,1] or setting[1] not in [0,1]:
-					print('Invalid setting. Please enter a tuple or string with 2 binary elements to configure root registers')
-					return
-				self.inBuf[ads_num] = setting[1]==1
-				config = int(str(setting[0]) + str(setting[1]) + '000000',2)
-				byte.append(0x00)
-				byte.append(config)
-
-			elif category == 1: #Configure Data Rate
-				rates = np.array([2.5, 5, 10, 15, 25, 30, 50, 60, 100, 500, 1e3, 2e3, 3.75e3, 7.5e3, 15e3, 30e3])
-				#Ensure we have an acceptable value
-				if setting not in rates:
-					diff = np.abs(rates - setting)
-					setting = rates[np.argmin(diff)]
-					print('Data rate value not permitted. Rounding to ' + str(setting))
-
-				self.adsRate[ads_num] = setting
-
-				config = np.where(rates == setting)[0][0]
-				byte.append(0x01)
-				byte.append(config)
-
-			elif category == 2: #Configure PGA Gain
-				gains = np.array([1, 2, 4, 8, 16, 32, 64])
-				
-				if setting not in gains:
-					diff = np.abs(gains - setting)
-					setting = gains[np.argmin(diff)]
-					print('Gain value not permitted. Rounding to ' + str(setting))
-
-				self.adsGain[ads_num] = setting
-
-				config = np.where(gains == setting)[0][0]
-				byte.append(0x02)
-				byte.append(config)
-
-			elif category == 3: #Configure Positive Channel
-				if setting not in [0,1,2,3]:
-					print('Please enter a channel between 0 and 3 (inclusive)')
-					return
-				byte.append(0x03)
-				byte.append(setting)
-
-			elif category == 4: #Configure Negative Channel
-				if setting not in [0,1,2,3]:
-					print('Please enter a channel between 0 and 3 (inclusive)')
-					return
-				byte.append(0x04)
-				byte.append(setting)
-
-			elif category == 6: #self-calibrate
-				byte.append(0x06)
-				byte.append(0x00)
-
-			resp = self.__do(byte,regex='\w+-\w+-[SF]')
-
-			o,f = self.ads_report_registers(ads_num)
-			if o==2**25 or f==2**25:
-				print('Updating calibration constants failed. Please Retry')
-			else:
-				self.OFC[ads_num] = o
-				self.FSC[ads_num] = f
+		elif category == 4: #Configure Negative Channel
+			if setting not in [0,1,2,3]:
+				print('Please enter a channel between 0 and 3 (inclusive)')
+				return
+			settings.append(('adsChannel', (ads_num, 1), setting))
+			byte.append(0x04)
+			byte.append(setting)
 
-			return resp
+		elif category == 6: #self-calibrate
+			byte.append(0x06)
+			byte.append(0x00)
+
+		return byte
+
+	def changes_calibration(self, command, acal=None):
+		"""
+		Check whether an ADS configuration command can change the OFC and FSC calibration registers of that ADS,
+		so that they only have to be read again when they may have changed. They change on a self-calibration,
+		and on a data rate, gain or input buffer change while auto-calibration is enabled (or not known to be off).
+		Selecting the inputs never changes them
+		:param command the command bytes (see ads_command)
+		:param acal whether auto-calibration will be enabled when a data rate or gain command is handled. Defaults to the current setting
+		:return True if the registers have to be read again
+		"""
+		category = command[1] if len(command) > 1 else None
+		if category == 6:
+			return True
+		if category == 0:
+			#A root command sets ACAL itself, and enabling it (or changing the buffer with it enabled) starts a calibration
+			return command[2] & 0x80 != 0
+		if category in (1, 2):
+			if acal == None:
+				acal = self.adsAcal[command[0] - 0x31]
+			return acal != False
+		return False
+
+	def config(self):
+		"""
+		:return the shadow copy of the device configuration as a dictionary
+		"""
+		return {
+			'inBuf': list(self.inBuf),
+			'adsGain': [int(g) for g in self.adsGain],
+			'adsRate': [float(r) for r in self.adsRate],
+			'adsAcal': list(self.adsAcal),
+			'adsChannel': [list(c) for c in self.adsChannel],
+			'dacCurrent': list(self.dacCurrent),
+			'OFC': list(self.OFC),
+			'FSC': list(self.FSC)
+			}
+
+	def config_key(self):
+		"""
+		Find the FTDI serial number of the opened device, which identifies the sensor unlike the description
+		that every adapter of a model shares
+		:return serial/portNum under which the configuration of this sensor is saved,
+			or None if the device cannot be told apart from other connected devices
+		"""
+		try:
+			devices = ftdi.Driver().list_devices()
+		except ftdi._base.FtdiError:
+			return None
+		serials = [serial for manufacturer, description, serial in devices if self.deviceID in (serial, description)]
+		if len(serials) != 1:
+			return None
+		return serials[0] + '/' + str(self.portNum)
+
+	def save_config(self, filename=None):
+		"""
+		Save the shadow copy of the device configuration under this sensor's serial number and portNum (see config_key),
+		so that a later session can restore it instead of reading the registers (see load_config)
+		:param filename the JSON file holding the configurations of all sensors. Defaults to CONFIG_FILE
+		:return True if the configuration was saved
+		"""
+		key = self.config_key()
+		if key == None:
+			print('Cannot tell this sensor apart from other connected devices. Configuration not saved')
+			return False
+		if filename == None:
+			filename = CONFIG_FILE
+		configs = {}
+		if os.path.exists(filename):
+			with open(filename) as f:
+				configs = json.load(f)
+		configs[key] = self.config()
+		with open(filename, 'w') as f:
+			json.dump(configs, f, indent=1, sort_keys=True)
+		return True
+
+	def load_config(self, filename=None):
+		"""
+		Restore the configuration saved for this sensor with save_config(). Nothing is sent to the sensor,
+		so this is only valid if the sensor was not power cycled or reconfigured since
+		:param filename the JSON file holding the configurations of all sensors. Defaults to CONFIG_FILE
+		:return True if a valid configuration was found for this sensor
+		"""
+		key = self.config_key()
+		if key == None:
+			print('Cannot tell this sensor apart from other connected devices. Configuration not restored')
+			return False
+		if filename == None:
+			filename = CONFIG_FILE
+		if not os.path.exists(filename):
+			return False
+		with open(filename) as f:
+			config = json.load(f).get(key)
+		if config == None:
+			return False
+
+		#Only take a complete configuration of the settings config() saves, so that a stale or edited file cannot set anything else
+		expected = self.config()
+		if sorted(config.keys()) != sorted(expected.keys()):
+			print('Saved configuration does not match this version. Ignoring it')
+			return False
+		for name, value in config.items():
+			if type(value) != list or len(value) != len(expected[name]):
+				print('Saved configuration has an invalid ' + name + '. Ignoring it')
+				return False
+		if any(type(c) != list or len(c) != 2 for c in config['adsChannel']) or any(r not in self.ab for r in config['adsRate']):
+			print('Saved configuration has invalid ADS settings. Ignoring it')
+			return False
+
+		for name in expected:
+			setattr(self, name, config[name])
+		self.update_ads_coefficients()
+		return True
+
+	def update_ads_coefficients(self):
+		"""
+		Recompute the per-channel coefficients that convert raw ADS values to volts (see sensor_output.ads_coefficients).
+		This must be called whenever the data rate, gain, input buffer or calibration registers of an ADS change
+		"""
+		a = [self.ab[self.adsRate[i]][0] for i in range(6)]
+		b = [self.ab[self.adsRate[i]][1] for i in range(6)]
+		self.ads_scale, self.ads_offset = out.ads_coefficients(self.adsGain, self.vref, a, b, self.OFC, self.FSC)
+		#Settings the parsed samples are checked for saturation with
+		self.ads_gain = list(self.adsGain)
+		self.ads_buffered = list(self.inBuf)
 
 	def set_ads_drate(self, ads_num, data_rate):
 		"""
@@ -557,35 +771,28 @@ class Sensor:
 		"""
 		
 		if ads_num == -1:
-			for i in range(6):
-				ofc, fsc = self.ads_report_registers(i)
-			return ofc, fsc
+			return self.__read_registers(range(6))[-1]
 
-		resp = self.__do([0x30+ads_num+1,0x05,0x00], toHex=False, regex='\w+-\w+-[SF]')
-		ok = False
-		startIndex = 0
-		try:
-			startIndex = resp.index(0xAA)+1
-			ok = self.__check_crc(resp[startIndex+6],resp[startIndex-1:startIndex+6],8)
-		except ValueError:
-			print('Failed to report FSC and OSC registers')
-			return 2**25, 2**25
-
-		if ok:
-			ofc = self.toInt(resp[startIndex:startIndex+3],lsb_first=True)
-			#Check if ofc is negative and find 2's complement accordingly
-			if ofc >= 2**23:
-				ofc -= 2**24
-			fsc = self.toInt(resp[startIndex+3:startIndex+6],lsb_first=True)
-			return ofc, fsc
-		else:
-			print('Failed to report FSC and OSC registers: Checksum failed')
-			return 2**25, 2**25
+		return self.__read_registers([ads_num])[0]
+
+	def __read_registers(self, ads_nums):
+		"""
+		Request the calibration registers of several ADSs back to back and parse all the replies together
+		:param ads_nums the indices of the ADSs (0-5)
+		:return list of (OFC, FSC) in the same order. Both are 2**25 for an ADS whose reply failed
+		"""
+		records, resp = self.__exchange([[0x30+i+1,0x05,0x00] for i in ads_nums])
+		reported = dict((r.ads_num, (r.ofc, r.fsc)) for r in records if isinstance(r, response.registers))
+		missing = [i for i in ads_nums if i not in reported]
+		if missing:
+			print('Failed to report FSC and OSC registers of ADS ' + ', '.join([str(i+1) for i in missing]))
+		return [reported.get(i, (2**25, 2**25)) for i in ads_nums]
 
 	def config_dac(self, channel, voltage):
 		"""
 		Configure the DAC by setting the output voltage of a specified channel or powering off a channel
 		:param channel the channel to set the voltage of (int between 1 and 6, inclusive)
+			-1 sets all channels, with the commands sent back to back (see config_transaction)
 		:param voltage the voltage to set the output of the selected channel to. This should be between 0 and 50mA
 			input 0 to shut a channel off
 		"""
@@ -593,189 +800,239 @@ class Sensor:
 			print('Failed. In continuous data mode. Call stop_data_transmission() first.')
 			return
 
-		if channel == -1:
-			resp = ''
-			for i in range(6):
-				resp += self.config_dac(i, voltage)
-			return resp
-		else:
-			voltage = voltage * 0xFFF / 50
+		t = self.transaction()
+		if not t.dac(channel, voltage):
+			return
+		return t.commit()
+
+	def dac_command(self, channel, voltage, settings=None):
+		"""
+		Build the command that configures one DAC channel (see config_dac) without sending it
+		:param channel the index of the channel (0-5)
+		:param settings list to which the setting of this object the command changes is appended (see ads_command)
+		:return the command as a list of bytes, or None if the channel is invalid
+		"""
+		current = voltage
+		voltage = int(voltage * 0xFFF / 50)
 
-			config = []
+		config = []
 
-			if channel < 0 or channel > 5:
-				print('Invalid channel number. Input a number between 1 and 7, inclusive')
-				return
+		if channel < 0 or channel > 5:
+			print('Invalid channel number. Input a number between 1 and 7, inclusive')
+			return
+		if settings != None:
+			settings.append(('dacCurrent', channel, current))
 
-			channel += 1
-			if voltage == 0:
-				config = [0x47, channel<<4, 0x00]
-			else:
-				volts_hex = self.toHex(voltage)
+		channel += 1
+		if voltage == 0:
+			config = [0x47, channel<<4, 0x00]
+		else:
+			volts_hex = self.toHex(voltage)
 
-				#Adjust the length to 12 bits
-				while len(volts_hex) < 3:
-					volts_hex = '0' + volts_hex
+			#Adjust the length to 12 bits
+			while len(volts_hex) < 3:
+				volts_hex = '0' + volts_hex
 
-				config = [(4<<4) + channel, int(volts_hex[:1],16), int(volts_hex[1:], 16)]
-			return self.__do(config, with_crc8=True, regex='\w+-\w+-[SF]',fast=True)
+			config = [(4<<4) + channel, int(volts_hex[:1],16), int(volts_hex[1:], 16)]
+		return config
 
 	def turn_on_led(self, ledNum):
 		return self.config_dac(ledNum, 20)
 	def turn_on_leds(self,ledNums):
-		resp = ''
-		for num in ledNums:
-			resp += self.config_dac(num, 20)
-		return resp
+		return self.__set_leds(ledNums, 20)
 	def turn_on_leds_all(self):
-		resp = ''
-		for i in range(6):
-			resp += self.config_dac(i,20)
-		return resp
+		return self.config_dac(-1, 20)
 	def turn_off_led(self, ledNum):
 		return self.config_dac(ledNum, 0)
 	def turn_off_leds(self,ledNums):
-		resp = ''
-		for num in ledNums:
-			resp += self.config_dac(num, 0)
-		return resp
+		return self.__set_leds(ledNums, 0)
 	def turn_off_leds_all(self):
-		resp = ''
-		for i in range(6):
-			resp += self.config_dac(i,0)
-		return resp
+		return self.config_dac(-1, 0)
+
+	def __set_leds(self, ledNums, current):
+		if self.block:
+			print('Failed. In continuous data mode. Call stop_data_transmission() first.')
+			return
+		t = self.transaction()
+		for num in ledNums:
+			if not t.dac(num, current):
+				return
+		return t.commit()
+
+	###  Configuration transactions  ###
+
+	def transaction(self):
+		"""
+		Start a batch of configuration commands (see config_transaction)
+		:return an empty config_transaction for this sensor
+		"""
+		return config_transaction(self)
+
+	def commit(self, transaction, verbose=True):
+		"""
+		Send all the commands of a transaction back to back and wait for all their acknowledgements at once.
+		Then let the ADSs calibrate and read the calibration registers of every ADS they may have changed, again back to back
+		:param transaction the config_transaction to send
+		:return the acknowledgements received
+		"""
+		if self.block:
+			print('Failed. In continuous data mode. Call stop_data_transmission() first.')
+			return
+		if not transaction.commands:
+			return ''
+		records, resp = self.__exchange(transaction.commands)
+
+		#Only record the settings the sensor acknowledged. A failed command changed nothing,
+		#but one that was not acknowledged at all may or may not have been applied
+		acked = dict((id(r.command), r.success) for r in records if isinstance(r, response.ack) and r.command != None)
+		for command, settings in zip(transaction.commands, transaction.settings):
+			success = acked.get(id(command))
+			for name, index, value in settings:
+				if success:
+					self.__record(name, index, value)
+				elif success == None and name in UNKNOWN_SETTINGS:
+					self.__record(name, index, None)
+
+		if transaction.ads_nums:
+			#The acknowledgement can arrive before the calibration is done, which takes longer at low data rates
+			slowest = min([self.adsRate[i] for i in transaction.ads_nums])
+			time.sleep(max(ADS_CALIBRATION_TIME, ADS_CALIBRATION_PERIODS / float(slowest)))
+			registers = self.__read_registers(transaction.ads_nums)
+			for ads_num, (o, f) in zip(transaction.ads_nums, registers):
+				if o==2**25 or f==2**25:
+					print('Updating calibration constants failed. Please Retry')
+				else:
+					self.OFC[ads_num] = o
+					self.FSC[ads_num] = f
+		self.update_ads_coefficients()
+		return self.__format_response(records, resp, verbose)
+
+	def __record(self, name, index, value):
+		"""
+		Record one setting in the shadow copy of the device configuration
+		:param name the name of the setting (e.g. 'adsGain')
+		:param index the channel, or (ADS, input) for adsChannel
+		"""
+		if name == 'adsChannel':
+			self.adsChannel[index[0]][index[1]] = value
+		else:
+			getattr(self, name)[index] = value
 
 	#########   Data transmission #######
 
-	def __do(self, task, verbose=True, expect_package=False, with_crc8=True, toHex=True, regex=None, fast=False):
+	def __do(self, task, verbose=True, expect_package=False, with_crc8=True, timeout=COMMAND_TIMEOUT):
 		"""
 		Send an arbitrary command given by task and potentially read the response. This method is thread safe and acquires/releases a lock around its read/write operations so the serial communication does not get messed up 
+		The command returns as soon as its response is complete instead of after a fixed delay
 			:param task byte to send to device 
-			:param verbose indicates whether or not to print the bytes received before finding an init byte or timing out 
+			:param verbose indicates whether or not to print the response
 			:param expect_package indicates whether to attempt to read in and parse a 53 byte packet after sending the command 
 			:param with_crc8 indicates whether to append a crc8 to the message (True), or not (False) 
-			:return parsed response from sensor if expect_package is True. None otherwise 
+			:param timeout seconds to wait for the response
+			:return parsed response from sensor if expect_package is True. The acknowledgement otherwise (see __format_response)
 		"""
+		if not expect_package:
+			records, resp = self.__exchange([task], with_crc8, timeout)
+			return self.__format_response(records, resp, verbose)
+
 		#Write the command, ensuring it is a bytes object, and that no other thread is trying to write at this time
 		self.threadLock.acquire()
-		toWrite = self.toStr(task, with_crc8=with_crc8)
-		self.write(toWrite)
-
-		if not fast:
-			time.sleep(0.2)
-		else:
-			time.sleep(0.001)
-
-		if expect_package:
-			timeout = 200
-			flag = self.wait_for_packet(timeout, verbose=verbose)
-			if flag:
-				data = self.readBytes(53)
-				self.threadLock.release()
-				return self.__parse(data) if (data != None and len(data) == 53) else None
-			else: #If it did time out, return empty sensor output
-				self.threadLock.release()
-				return None
-		else:
-			resp = self.read_packet(timeout=300)
-			h = ''
-			if resp != []:
-				for num in resp:
-					h += self.toHex(num, padded=True)
-				h = h.decode('hex')
-
-				#Try to match regex
-				if regex != None:
-					match = re.findall(regex,h)
-					if match != []:
-						h = ''
-						count = 0
-						for string in match:
-							h += string + '. '
-							count += 1
-							if count % 4 == 0:
-								h += '\n'
-						if h[-1] != '\n':
-							h += '\n'
-
-			if verbose:
-				print(h)
+		try:
+			self.write(self.toStr(task, with_crc8=with_crc8))
+			packet = self.__read_frame(timeout)
+		finally:
 			self.threadLock.release()
-			if toHex:
-				return h
-			else:
-				return resp
-
-	def wait_for_packet(self, timeout=50, verbose=False):
-		"""
-		Scan the incoming data for the initialization byte. If one is found, test the checksum in the next byte. 
-		If the checksum matches, return True. The program should then read in the next 53 bytes as a packet.
-		:param timeout how many bytes to attempt before stopping and giving up, returning False
-		:param verbose Set to true to print out all the extra bytes that were read in before receiving a star byte or timing out
-		:return True if the program can read in the next 53 bytes as a valid data packet
-			False if no start byte + checksum combination is found within timeout tries
-		"""
-		data = ''
-		for i in range(timeout):
-			#Check for initialization byte
-			dat = self.readBytes(1) 
-			if dat == [INIT_BYTE]:
-				#Print all the garbage that was read in
-				if verbose and data != '':
-					print(data)
-
-				#Read next 2 bytes (counter and crc8)
-				byte = self.readBytes(2)
-				if byte != None and byte != []:
-					counter = byte[0]
-					crc = byte[1]
-				else:
-					continue
-
-				#Combine initialization byte and counter
-				p = [INIT_BYTE, counter]
-
-				#Test checksum
-				return self.__check_crc(crc,p,8)
-			elif dat == [0]:
-				i -= 1
-			else:
-				if dat != [] and dat != None:
-					data += self.toHex(dat[0],padded=True)
-
-		#Print all the garbage that was read in
-		if verbose and data != '':
-			print(data.decode('hex'))
-		return False
+		if packet == None: #If it did time out, return empty sensor output
+			return None
+		return self.__parse(packet)
 
-	def read_packet(self, timeout=200):
+	def __do_many(self, tasks, verbose=True, timeout=COMMAND_TIMEOUT):
 		"""
-		Read arbitrary package and return as list of integer bytes
+		Send several commands back to back in one write and read all their responses together
+			:param tasks list of commands (lists of bytes). A crc8 is appended to each
+			:return the acknowledgements (see __format_response)
 		"""
-		count = 0
-		d = self.readBytes(1)
-		data = []
-		#Wait for start of package
-		while d == []:
-			d = self.readBytes(1)
-			count = count + 1
-			if count == timeout:
-				print('No response received')
-				return data
+		records, resp = self.__exchange(tasks, True, timeout)
+		return self.__format_response(records, resp, verbose)
 
-		count = 0
-		failed = 0
-		while failed < 20:
-			if d == []:
-				failed += 1
-			else:
-				data.append(d[0])
-				count = count + 1
-				if count > timeout:
+	def __exchange(self, tasks, with_crc8=True, timeout=COMMAND_TIMEOUT):
+		"""
+		Send commands in one write and read the replies until every command is answered, or until the timeout.
+		The sensor handles commands in order, so all of them can be in flight at once (see response.response_parser)
+			:param tasks list of commands (lists of bytes)
+			:return records, resp where records is the list of response.ack and response.registers records
+				in the order they were received, and resp all the bytes received
+		"""
+		parser = self.responses
+		self.threadLock.acquire()
+		try:
+			parser.reset()
+			for task in tasks:
+				parser.sent(task)
+			self.write(b''.join([self.toStr(task, with_crc8=with_crc8) for task in tasks]))
+
+			records = []
+			resp = bytearray()
+			deadline = timing.now() + timeout
+			while not parser.done():
+				data = self.readBytes(RESPONSE_CHUNK)
+				if data:
+					resp += data
+					parser.feed(data)
+					records.extend(parser.records())
+				elif timing.now() > deadline:
+					if not resp:
+						print('No response received')
+					else:
+						print('No acknowledgement received for ' + str(len(parser.waiting)) + ' of ' + str(len(tasks)) + ' commands')
 					break
-			d = self.readBytes(1)
-
-		return data
+				else:
+					#Yield the GIL instead of spinning on the port
+					time.sleep(0.0002)
+		finally:
+			self.threadLock.release()
+		return records, resp
+
+	def __format_response(self, records, resp, verbose):
+		"""
+		Turn the acknowledgements of a response into text
+		:param records the records of the response (see __exchange)
+		:param resp the bytes of the response, returned as text if it contained no acknowledgement
+		:return the text
+		"""
+		h = ''
+		acks = [r.text for r in records if isinstance(r, response.ack)]
+		if acks:
+			for count, string in enumerate(acks):
+				h += string + '. '
+				if count % 4 == 3:
+					h += '\n'
+			if h[-1] != '\n':
+				h += '\n'
+		elif resp:
+			h = resp.decode('latin-1')
+
+		if verbose:
+			print(h)
+		return h
+
+	def __read_frame(self, timeout=COMMAND_TIMEOUT):
+		"""
+		Read until a complete data frame with valid checksums arrives, or until the timeout
+		:return the 53 byte packet of the frame, or None if none arrived
+		"""
+		framer = self.poll_framer
+		framer.reset()
+		deadline = timing.now() + timeout
+		while timing.now() < deadline:
+			data = self.readBytes(RESPONSE_CHUNK)
+			if data:
+				framer.feed(data)
+				for packet in framer.frames():
+					return packet
+			else:
+				time.sleep(0.0002)
+		return None
 
 	###########    Helper Methods    ###########
 
@@ -810,7 +1067,7 @@ class Sensor:
 	    """
 
 	    if type(p) == int:
-	    	p = self.toBytesList(self.toHex(p))
+	    	p = crc.toBytesList(p)
 	    if type(crc_) != int:
     		crc_ = self.toInt(crc_)
 
@@ -856,7 +1113,7 @@ class Sensor:
 		except KeyError:
 			print('Invalid report ID key')
 
-		return out.sensor_output(self, packet, rid, self.calMatrix)
+		return out.sensor_output(self, packet, rid, self.calMatrix, self.eager)
 
 	def readBytes(self, num_bytes):
 		if self.block:
@@ -870,12 +1127,8 @@ class Sensor:
 			self.num_errors += 1
 			if self.num_errors == 100:
 				raise ftdi._base.FtdiError('Failed too many times. Exiting...')
-			return []
-		try:
-			retval = self.toBytesList(read_in)
-			return retval
-		except ValueError:
-			return []
+			return bytearray()
+		return self.toBytesList(read_in)
 
 	def readLine(self, startChar=None, startChar2=None, endChar='\n', timeout=100):
 		"""
@@ -887,28 +1140,28 @@ class Sensor:
 		:param timeout how many bytes to read, looking for the startChar and then endChar before giving up
 		"""
 		if startChar != None:
-			startByte = int(codecs.encode(startChar, 'hex'),16)
-			startByte2 = int(codecs.encode(startChar2, 'hex'),16)
+			startByte = bytearray(startChar.encode('latin-1'))
+			startByte2 = bytearray(startChar2.encode('latin-1'))
 		if endChar != None:
-			endByte = int(codecs.encode(endChar, 'hex'),16)
+			endByte = bytearray(endChar.encode('latin-1'))
 
 		#Look for the start byte
 		d = self.readBytes(1)
 		count = 0
-		while d != [startByte] and d != [startByte2] and count < timeout:
+		while d != startByte and d != startByte2 and count < timeout:
 			d = self.readBytes(1)
 			count += 1
 
 		#Exit if it couldn't be found
 		if count == 1000:
-			return []
+			return bytearray()
 
 		#Look for the end byte
-		line = []
+		line = bytearray()
 		count = 0
-		while d != [endByte] and count < timeout:
-			if d != []:
-				line.append(d[0])
+		while d != endByte and count < timeout:
+			if d:
+				line += d
 			d = self.readBytes(1)
 			count += 1
 
@@ -937,18 +1190,11 @@ class Sensor:
 
 	def toBytesList(self, string):
 		"""
-		Split a hexadecimal string of any length into a list of bytes
-		:param string the hexadecimal string to convert
+		Wrap the bytes read from the port in a bytearray, which can be indexed
+		and sliced like a list of ints without converting each byte separately
+		:param string the bytes to convert
 		"""
-		
-		string = codecs.encode(string, 'hex')
-
-		#Watch out for leading zeros
-		if len(string) % 2 != 0:
-			string = '0' + string
-
-		#Split into list and return
-		return [int(string[i:i+2],16) for i in range(0,len(string),2)]
+		return bytearray(string)
 
 	def toStr(self, byte_list, with_crc8=False, format=0):
 		"""
@@ -994,7 +1240,7 @@ class Sensor:
 		"""
 		The only reliable Python 2 and 3- compatible int-to-bytes conversion I could find 
 		"""
-		byte = ''
+		byte = b''
 		if type(byteList) == int:
 			byteList = [byteList]
 
@@ -1002,6 +1248,98 @@ class Sensor:
 			byte += struct.pack("B", num)
 		return byte
 
+class config_transaction:
+	"""
+	Configuration commands for several ADS and DAC channels that are queued, then sent back to back
+	with Sensor.commit() so that reconfiguring the sensor takes about one round trip instead of one per channel.
+	Every ADS whose calibration registers may have changed (see Sensor.changes_calibration) has them read back
+	afterwards, also in one batch.
+	Settings are checked as they are queued, and recorded in the Sensor once the sensor acknowledges them. Channel -1 selects all six channels
+
+	To use:
+		t = sensor.transaction()
+		t.pga(-1, 8)
+		t.drate(-1, 1000)
+		t.dac(-1, 20)
+		print(t.commit())
+	"""
+
+	def __init__(self, sensor):
+		self.sensor = sensor
+		self.commands = [] #Command bytes, in the order they will be sent
+		self.settings = [] #The (name, index, value) settings each command changes (see Sensor.ads_command)
+		self.ads_nums = [] #ADSs whose calibration registers may have changed and have to be read back
+
+	def ads(self, ads_num, category, setting):
+		"""
+		Queue an ADS configuration command (see Sensor.__config_ads for the categories and settings)
+		:return True if the command was queued, False if it was invalid
+		"""
+		for i in (range(6) if ads_num == -1 else [ads_num]):
+			settings = []
+			byte = self.sensor.ads_command(i, category, setting, settings)
+			if byte == None:
+				return False
+			if self.sensor.changes_calibration(byte, self.queued('adsAcal', i)) and i not in self.ads_nums:
+				self.ads_nums.append(i)
+			self.commands.append(byte)
+			self.settings.append(settings)
+		return True
+
+	def queued(self, name, index):
+		"""
+		:return the value a queued command sets a setting to (the last one if several do), None if none does
+		"""
+		value = None
+		for settings in self.settings:
+			for n, i, v in settings:
+				if n == name and i == index:
+					value = v
+		return value
+
+	def root(self, ads_num, ACAL, IN_BUFF):
+		return self.ads(ads_num, 0, (ACAL, IN_BUFF))
+
+	def drate(self, ads_num, data_rate):
+		return self.ads(ads_num, 1, data_rate)
+
+	def pga(self, ads_num, gain):
+		return self.ads(ads_num, 2, gain)
+
+	def channel(self, ads_num, channel, positive=True):
+		return self.ads(ads_num, 3 if positive else 4, channel)
+
+	def self_calibrate(self, ads_num):
+		return self.ads(ads_num, 6, 0)
+
+	def dac(self, channel, voltage):
+		"""
+		Queue a DAC command (see Sensor.config_dac)
+		:return True if the command was queued, False if it was invalid
+		"""
+		for i in (range(6) if channel == -1 else [channel]):
+			settings = []
+			config = self.sensor.dac_command(i, voltage, settings)
+			if config == None:
+				return False
+			self.commands.append(config)
+			self.settings.append(settings)
+		return True
+
+	def led(self, ledNum, on=True):
+		return self.dac(ledNum, 20 if on else 0)
+
+	def commit(self, verbose=True):
+		"""
+		Send the queued commands and empty the queue (see Sensor.commit)
+		:return the acknowledgements received
+		"""
+		resp = self.sensor.commit(self, verbose)
+		self.commands = []
+		self.settings = []
+		self.ads_nums = []
+		return resp
+
 ################################################################################################################
 ################################################################################################################
 ################################################################################################################
@@ -1026,13 +1364,9 @@ class read_thread (QtCore.QThread):
 		self.exitFlag = False
 		self.numAdded = 0
 		self.parent = parent
-		self.rep_ids = {
-			1: 'Accelerometer',
-			2: 'Gyroscope',
-			4: 'Linear Acceleration',
-			5: 'Rotation Vector',
-			8: 'Game Rotation Vector'
-			}
+		self.framer = framing.frame_sync(port, parent.crc8_table, parent.crc32_table)
+		self.clock = timing.sample_clock()
+		self.rep_ids = out.REPORT_NAMES
 
 	def readBytes(self, num_bytes):
 		try:
@@ -1048,12 +1382,7 @@ class read_thread (QtCore.QThread):
 			if self.error_count == 10:
 				raise ftdi._base.FtdiError('Failed too many times. Exiting...')
 			return None
-		try:
-			retval = self.toBytesList(read_in)
-			return retval
-		except ValueError:
-			print('Error converting received data to bytes')
-			return None
+		return self.toBytesList(read_in)
 
 	def toHex(self, num, padded=False):
 		if num == b'':
@@ -1066,57 +1395,6 @@ class read_thread (QtCore.QThread):
 		else:
 			return h
 
-	def wait_for_packet(self, timeout=1000):
-		"""
-		Scan the incoming data for the initialization byte. If one is found, test the checksum in the next byte. 
-		If the checksum matches, return True. The program should then read in the next 53 bytes as a packet.
-		:param timeout how many bytes to attempt before stopping and giving up, returning False
-		:param verbose Set to true to print out all the extra bytes that were read in before receiving a star byte or timing out
-		:return True if the program can read in the next 53 bytes as a valid data packet
-			False if no start byte + checksum combination is found within timeout tries
-		"""
-		data = ''
-		for i in range(timeout):
-			#Check for initialization byte
-			try:
-				dat = self.port.read(1) 
-				if dat == b'\xAA':
-					#Read next 2 bytes (counter and crc8)
-					byte = self.readBytes(2)
-					if byte != None and byte != []:
-						counter = byte[0]
-						crcVal = byte[1]
-					else:
-						continue
-
-					#Combine initialization byte and counter
-					p = [INIT_BYTE, counter]
-
-					#Test CRC8 checksum
-					return crc.crc8(p, table=self.parent.crc8_table) == crcVal
-			except:
-				print('Communication failing. Replug USB')
-				continue
-
-	def __check_crc32(self, crc_val, p):
-	    """
-	    Check crc Checksum with 32 bits
-	    :param crc the 32 bit checksum as a list of bytes (ints) or an int
-	    :param p the list of bytes to compare to the checksum. (This is bytes 0 to 46 in the 53 byte sensor packet)
-	    :param polynomial the bit string of the crc polynomial to use
-	    	Default is 0x04C11DB7 which is what we use for n=32
-	    :return True if the checksum matches, False otherwise
-	    """
-	    if type(p) == int:
-	    	p = self.toHex(p)
-	    	p = self.toBytesList(p)
-	    if type(crc_val) != int:
-	    	crc_val = self.toInt(crc_val)
-
-	    checksum = crc.crc32(p, table=self.parent.crc32_table)
-
-	    return checksum == crc_val
-
 	def toInt(self, byte, lsb_first=False):
 		"""
 		Helper method to convert a list of bytes where the least significant byte is 
@@ -1139,31 +1417,18 @@ class read_thread (QtCore.QThread):
 
 	def toBytesList(self, string):
 		"""
-		Split a hexadecimal string of any length into a list of bytes
-		:param string the hexadecimal string to convert
+		Wrap the bytes read from the port in a bytearray, which can be indexed
+		and sliced like a list of ints without converting each byte separately
+		:param string the bytes to convert
 		"""
-		string = codecs.encode(string, 'hex')
-
-		#Watch out for leading zeros
-		if len(string) % 2 != 0:
-			string = '0' + string
-
-		#Split into list and return
-		return [int(string[i:i+2],16) for i in range(0,len(string),2)]
+		return bytearray(string)
 
 	def __parse(self, packet):
 		"""
-		Parse the data packet of 53 bytes using the SH-2 structure
+		Parse the data packet of 53 bytes using the SH-2 structure.
+		The framer has already checked the CRC32 checksum of the packet
 		:return sensor_output object which contains the parsed data in a useful form
-			returns a sensor_output object containing only the original received packet
-				if the packet length is not 53 bytes
-			returns None if the crc checksum did not match
 		"""
-
-		if not self.__check_crc32(packet[49:],packet[:49]):
-			return out.sensor_output()
-			print('Checksum Failed')
-
 		rid = 'None'
 
 		try:
@@ -1171,32 +1436,43 @@ class read_thread (QtCore.QThread):
 		except KeyError:
 			print('Invalid report ID key')
 
-		return out.sensor_output(self.parent, packet, rid, self.parent.calMatrix)
+		parsed = out.sensor_output(self.parent, packet, rid, self.parent.calMatrix, self.parent.eager)
+		parsed.counter = self.framer.counter
+		parsed.dropped = self.framer.dropped
+		parsed.duplicate = self.framer.duplicate
+		parsed.index = self.framer.index
+		parsed.rx_time = self.framer.rx_time
+		parsed.time = self.clock.update(parsed.index, parsed.rx_time)
+		return parsed
 
 	def run(self):
 		"""
 		What this thread actually does. This is executed when thread.start() is called. It should read
-		data from serial and save it to the global data queue so the main thread can use it. The thread 
+		data from serial and save it to the parent's ring buffer so the main thread can use it. The thread 
 		ends if exitFlag is set to True, which happens when stop_data_transfer() is called
 		"""
-		global data_stream
+		self.framer.reset()
+		self.clock = timing.sample_clock(self.parent.data_rate)
 		while (True): #Run until exitFlag is set
 			if self.exitFlag:
 				break
 
-			#Read 53 bytes, ensuring they are all from one package by finding the initialization byte first
-			# try:
-			do_read = self.wait_for_packet()
-
-			if do_read: #If it didn't time out, go ahead with read/write
-				self.threadLock.acquire()
-				data = self.readBytes(53)
-				if data != None and len(data) == 53: #If there was an error, ignore and move on
-					parsed = self.__parse(data)
-					self.data_source.emit(parsed)
-					data_stream = parsed
-					self.numAdded += 1
-					self.threadLock.release()
-				else:
-					print('Failed to read a packet')
+			#Read a large chunk and parse every complete packet in it
+			try:
+				packets = self.framer.read_frames()
+			except ftdi._base.FtdiError:
+				print('Communication failing. Replug USB')
+				self.error_count += 1
+				if self.error_count == 10:
+					raise ftdi._base.FtdiError('Failed too many times. Exiting...')
+				continue
 
+			added = self.numAdded
+			for data in packets:
+				parsed = self.__parse(data)
+				self.data_source.emit(parsed)
+				self.parent.buffer.put(parsed)
+				self.numAdded += 1
+			if self.numAdded == added:
+				#Nothing buffered yet. Yield the GIL instead of spinning on the port
+				time.sleep(0.0005)
@@ -1,7 +1,43 @@
-from math import atan2, asin, copysign
+from math import atan2, asin, copysign, sqrt
+import struct
 from numpy import pi
 import numpy as np
 
+def ads_coefficients(gain, vref, a, b, ofc, fsc):
+	"""
+	Rewrite the conversion of Equation 4 (Pg. 34) of http://www.ti.com/lit/ds/symlink/ads1257.pdf
+	as Vin = scale * v + offset for each of the 6 channels, where v is the signed raw value
+	:param gain the 6 PGA gains
+	:param vref the reference voltage
+	:param a, b the 6 pairs of data rate dependent constants (see Sensor.ab)
+	:param ofc, fsc the 6 offset and full-scale calibration register values
+	:return scale, offset as lists of 6 floats
+	"""
+	scale = [2.0*vref / (gain[i]*b[i]*fsc[i]) for i in range(6)]
+	offset = [float(ofc[i]) / a[i] * 2.0*vref / gain[i] for i in range(6)]
+	return scale, offset
+
+#Coefficients used when no Sensor is given
+DEFAULT_SCALE, DEFAULT_OFFSET = ads_coefficients([1]*6, 2.5, [0x400000]*6, [1.8639]*6, [0]*6, [0x44ac08]*6)
+
+#Factor converting each of the 4 IMU words to a float for each report ID, given by its Q Point
+IMU_SCALES = {
+	1: (2.0**-8,)*4,
+	2: (2.0**-9,)*4,
+	4: (2.0**-8,)*4,
+	5: (2.0**-14,)*3 + (2.0**-12,),
+	8: (2.0**-14,)*4
+	}
+
+#Name of the IMU report for each report ID
+REPORT_NAMES = {
+	1: 'Accelerometer',
+	2: 'Gyroscope',
+	4: 'Linear Acceleration',
+	5: 'Rotation Vector',
+	8: 'Game Rotation Vector'
+	}
+
 class sensor_output:
 	"""
 	Class used to store parsed sensor outputs. The following data is included:
@@ -13,11 +49,36 @@ class sensor_output:
 	report_id : The topic of the IMU report, given by the report ID. (e.g. acceleration or rotation_vector)
 	checksum : The 32bit checksum returned by the sensor for error checking (Expressed as an int)
 	byte : The actual unparsed package of bytes
+	counter : The 8-bit frame counter sent with the packet in continuous mode (None if unknown)
+	dropped : The number of frames lost between the previous packet and this one
+	duplicate : True if the packet repeated the frame counter of the previous packet
+	index : The sample index of the packet in the continuous data session, counting dropped frames
+	rx_time : The monotonic host time at which the packet was received (see timing.now)
+	time : The estimated sample time of the packet on the same clock (see timing.sample_clock)
 
 	If the packet is of different length than 53 bytes, only the byte parameter will be initialized
 	since in this case it cannot be parsed according to our packet structure
+
+	Only byte and the report ID are parsed when the object is created. Every other field is decoded
+	the first time it is read and then stored, unless it is listed in eager
 	"""
-	def __init__(self, sensor=None, byte_data=None, type_str=None, calMatrix=None):
+	def __init__(self, sensor=None, byte_data=None, type_str=None, calMatrix=None, eager=()):
+		"""
+		:param sensor the Sensor whose ADC settings the packet is converted with. Defaults are used if None
+		:param byte_data the 53 byte packet to parse. An empty object is created if None
+		:param type_str the name of the IMU report
+		:param calMatrix the 6x6 calibration matrix used to compute the wrench
+		:param eager names of the fields to decode right away (e.g. ('wrench',)). All others are decoded
+			the first time they are read, so fields that are never used cost nothing
+		"""
+		#Frame counter information, filled in by the reader that received the packet
+		self.counter = None
+		self.dropped = 0
+		self.duplicate = False
+		self.index = None
+		self.rx_time = None
+		self.time = None
+
 		if byte_data == None:
 			self.byte = None
 			self.differential = None
@@ -37,93 +98,112 @@ class sensor_output:
 
 		else:
 			if sensor != None:
-				G = sensor.adsGain
+				#Snapshots taken by Sensor.update_ads_coefficients, so that later configuration changes
+				#do not affect fields that are decoded after this point
+				G = sensor.ads_gain
+				buf = sensor.ads_buffered
 				vref = sensor.vref
-				a = []
-				b = []
-				for i in range(6):
-					a.append(sensor.ab[sensor.adsRate[i]][0])
-					b.append(sensor.ab[sensor.adsRate[i]][1])
-				ofc = sensor.OFC
-				fsc = sensor.FSC
-				buf = sensor.inBuf
+				scale = sensor.ads_scale
+				offset = sensor.ads_offset
 			else:
 				G = [1]*6
-				vref = 2.5
-				a = [0x400000]*6
-				b = [1.8639]*6
-				ofc = [0]*6
-				fsc = [0x44ac08]*6
 				buf = [True]*6
-
-			self.saturated = [0]*6
-
-			#Convert all 6 values in differentials and sums to ints
-			self.differential_raw = [self.to_int(byte_data[i:i+3]) for i in range(0,18,3)]
-			
-			#print(fsc)
-			#print(ofc)
-			self.differential = [self.volts_ads(self.differential_raw[i], G[i], vref, a[i], b[i], ofc[i], fsc[i]) for i in range(6)]
-
-			self.sum_raw = [self.to_int(byte_data[i:i+3]) for i in range(18,36,3)]
-			self.sum = [self.volts_adc(self.sum_raw[i],vref) for i in range(6)]
-
-			for i in range(6):
-				self.checkSaturation(self.differential[i],self.sum[i],i,buf[i],G[i])
-			
-			self.wrench = [0,0,0,0,0,0] if 0 in self.sum else [self.differential[i] / self.sum[i] for i in range(6)]
-			self.wrench = np.matmul(calMatrix, self.wrench) 
-			self.wrench = [self.wrench[i] for i in range(6)]
+				vref = 2.5
+				scale = DEFAULT_SCALE
+				offset = DEFAULT_OFFSET
+			self.__params = (G, buf, vref, scale, offset, calMatrix)
 			self.byte = byte_data
 
 			#Save report ID
 			self.report_id_str = type_str
-			rid = byte_data[36]
-			self.report_id = rid
-
-			#Configure Q Point based on report ID
-			qpoint=0
-			if rid == 1 or rid == 4:
-				qpoint = 8
-			elif rid == 2:
-				qpoint = 9
-			elif rid == 8:
-				qpoint = 14
-
-			#Parse IMU data
-			#LSB is first byte that is returned
-			if rid != 5:
-				self.imu = [self.q_to_float(self.to_int(byte_data[i:i+2], lsb_first=True), qpoint) for i in range(37,47,2)]
-				self.imu = self.imu[:4]
-			else:
-				quat = [self.q_to_float(self.to_int(byte_data[i:i+2], lsb_first=True), 14) for i in range(37,43,2)]
-				quat.append(self.q_to_float(self.to_int(byte_data[43:45], lsb_first=True), 12))
-				quat.append(self.q_to_float(self.to_int(byte_data[45:47], lsb_first=True), 12))
-				self.imu = quat[:4]
-
-			if rid == 5 or rid == 8:
-				#Normalise if need be
-				mag = 0
-				for num in self.imu:
-					mag += num**2
-				mag = np.sqrt(mag)
-				if mag > 1.1:
-					self.imu = [self.imu[i] / mag for i in range(4)]
-
-				self.quaternion = self.imu
-
-				self.rotation = self.quaternionToRotation(self.imu)
-			else:
-				self.quaternion = None
+			self.report_id = byte_data[36]
 
-			#Parse Temperature Data
-			temp = self.to_int(byte_data[47:49])
-			if byte_data[47] >= 2048: #The number begins with 1 and is thus negative
-				temp -= 2**12 #2's complement
-			self.temperature = temp * 0.0625
+			#Everything else is decoded on first access (see __getattr__), except the fields asked for here
+			for name in eager:
+				getattr(self, name)
+
+	def __getattr__(self, name):
+		"""
+		Decode a field of the packet the first time it is read. Only called for attributes that are not set yet
+		"""
+		decode = self.decoders.get(name)
+		if decode == None or 'byte' not in self.__dict__:
+			raise AttributeError(name)
+		decode(self)
+		return self.__dict__[name]
+
+	def __decode_differential(self):
+		G, buf, vref, scale, offset, calMatrix = self.__params
+		#Convert all 6 values in differentials to ints
+		self.differential_raw = [self.to_int(self.byte[i:i+3]) for i in range(0,18,3)]
+		#Same as volts_ads, using the sensor's precomputed coefficients
+		self.differential = [(v - 2**24 if v >= 2**23 else v)*s + o for v, s, o in zip(self.differential_raw, scale, offset)]
+
+	def __decode_sum(self):
+		vref = self.__params[2]
+		self.sum_raw = [self.to_int(self.byte[i:i+3]) for i in range(18,36,3)]
+		sum_scale = vref / 2.0**12
+		self.sum = [v*sum_scale for v in self.sum_raw]
+
+	def __decode_saturation(self):
+		G, buf = self.__params[:2]
+		self.saturated = [0]*6
+		for i in range(6):
+			self.checkSaturation(self.differential[i],self.sum[i],i,buf[i],G[i])
+
+	def __decode_wrench(self):
+		calMatrix = self.__params[5]
+		self.wrench = [0,0,0,0,0,0] if 0 in self.sum else [self.differential[i] / self.sum[i] for i in range(6)]
+		self.wrench = np.matmul(calMatrix, self.wrench) 
+		self.wrench = [self.wrench[i] for i in range(6)]
+
+	def __decode_imu(self):
+		byte_data = self.byte
+		rid = self.report_id
+
+		#Parse IMU data with the Q Point of the report ID
+		#LSB is first byte that is returned
+		self.imu = [w*q for w, q in zip(struct.unpack('<4H', bytearray(byte_data[37:45])), IMU_SCALES.get(rid, (1.0,)*4))]
+
+		if rid == 5 or rid == 8:
+			#Normalise if need be
+			mag = sqrt(sum([num*num for num in self.imu]))
+			if mag > 1.1:
+				self.imu = [self.imu[i] / mag for i in range(4)]
+
+			self.quaternion = self.imu
+		else:
+			self.quaternion = None
 
-			#LSB comes last
-			self.checksum = self.to_int(byte_data[49:])
+	def __decode_rotation(self):
+		self.rotation = None if self.quaternion == None else self.quaternionToRotation(self.quaternion)
+
+	def __decode_temperature(self):
+		#Parse Temperature Data
+		byte_data = self.byte
+		temp = self.to_int(byte_data[47:49])
+		if byte_data[47] >= 2048: #The number begins with 1 and is thus negative
+			temp -= 2**12 #2's complement
+		self.temperature = temp * 0.0625
+
+	def __decode_checksum(self):
+		#LSB comes last
+		self.checksum = self.to_int(self.byte[49:])
+
+	#Method that decodes each lazily decoded field
+	decoders = {
+		'differential_raw': __decode_differential,
+		'differential': __decode_differential,
+		'sum_raw': __decode_sum,
+		'sum': __decode_sum,
+		'saturated': __decode_saturation,
+		'wrench': __decode_wrench,
+		'imu': __decode_imu,
+		'quaternion': __decode_imu,
+		'rotation': __decode_rotation,
+		'temperature': __decode_temperature,
+		'checksum': __decode_checksum
+		}
 
 	def isSaturated(self):
 		return sum(self.saturated) > 0
@@ -184,17 +264,17 @@ class sensor_output:
 
 		rm = np.zeros((3,3))
 
-	  	rm[0,0] = 1 - 2 * qJ**2 - 2 * qK**2;
-	    	rm[0,1] = 2 * qI * qJ - 2 * qR * qK;
-	    	rm[0,2] = 2 * qI * qK + 2 * qR * qJ;
-	    	rm[1,0] = 2 * qI * qJ + 2 * qR * qK;
-	    	rm[1,1] = 1 - 2 * qI**2 - 2 * qK**2;
-	    	rm[1,2] = 2 * qJ * qK - 2 * qR * qI;
-	    	rm[2,0] = 2 * qI * qK - 2 * qR * qJ;
-	    	rm[2,1] = 2 * qJ * qK + 2 * qR * qI; 
-	    	rm[2,2] = 1 - 2 * qI**2 - 2 * qJ**2;
-
-	    	return rm
+		rm[0,0] = 1 - 2 * qJ**2 - 2 * qK**2;
+		rm[0,1] = 2 * qI * qJ - 2 * qR * qK;
+		rm[0,2] = 2 * qI * qK + 2 * qR * qJ;
+		rm[1,0] = 2 * qI * qJ + 2 * qR * qK;
+		rm[1,1] = 1 - 2 * qI**2 - 2 * qK**2;
+		rm[1,2] = 2 * qJ * qK - 2 * qR * qI;
+		rm[2,0] = 2 * qI * qK - 2 * qR * qJ;
+		rm[2,1] = 2 * qJ * qK + 2 * qR * qI; 
+		rm[2,2] = 1 - 2 * qI**2 - 2 * qJ**2;
+
+		return rm
 
 	def failed(self):
 		if self.sum == None:
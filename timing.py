@@ -0,0 +1,115 @@
+import time
+import collections
+import numpy as np
+
+"""
+Host-side timestamping of continuous data.
+Packets are received in USB batches, so their receive times are jittery and arrive late by a varying amount.
+Since the sensor sends samples at a fixed rate, the sample times can instead be rebuilt from the sample index
+(the frame counter, unwrapped and corrected for dropped frames) and the data rate. The host receive times are
+only used to anchor that line and to estimate how far the sensor's clock drifts from the nominal data rate:
+a receive time is never earlier than the sample time plus the shortest transfer delay, so the earliest receive
+time (relative to the nominal rate) in each window of samples is a good estimate of the actual sample time,
+and a straight line fitted through those points gives the offset and the actual sample period.
+"""
+
+#Monotonic host clock used to stamp received data. Python 2 has no monotonic clock, so fall back on the wall clock
+now = getattr(time, 'monotonic', time.time)
+
+class sample_clock:
+	"""
+	Online estimate of the sample times of one continuous data session.
+	Call update() with the sample index and receive time of every frame, in order
+	"""
+
+	def __init__(self, data_rate=1500, window=None, history=30):
+		"""
+		:param data_rate the nominal sample rate in Hz
+		:param window the number of samples over which the earliest receive time is taken. Defaults to one second of data
+		:param history the number of windows used to fit the sample times
+		"""
+		self.data_rate = data_rate
+		self.nominal_period = 1.0 / data_rate
+		self.window = int(data_rate) if window == None else window
+		self.points = collections.deque(maxlen=history)
+		self.reset()
+
+	def reset(self):
+		"""
+		Forget all received samples, e.g. when a new session starts
+		"""
+		self.points.clear()
+		self.period = self.nominal_period
+		self.offset = None #Time of sample index 0
+		self.best = None #Earliest (index, receive time) of the current window
+		self.best_residual = None
+		self.window_start = 0
+		self.lowest = None #Earliest receive time relative to the nominal rate so far
+
+	def update(self, index, rx_time):
+		"""
+		Add one received frame and estimate its sample time
+		:param index the sample index of the frame (see framing.frame_sync.index)
+		:param rx_time the host time at which the frame was received
+		:return the estimated sample time of the frame, on the same clock as rx_time
+		"""
+		residual = rx_time - index*self.nominal_period
+		if self.lowest == None or residual < self.lowest:
+			self.lowest = residual
+		if self.best == None:
+			self.window_start = index
+		if self.best == None or residual < self.best_residual:
+			self.best = (index, rx_time)
+			self.best_residual = residual
+
+		if index - self.window_start >= self.window:
+			self.points.append(self.best)
+			self.best = None
+			if len(self.points) >= 2:
+				#Least squares fit of the window minima
+				idx = np.array([p[0] for p in self.points], dtype=np.float64)
+				t = np.array([p[1] for p in self.points])
+				self.period, self.offset = np.polyfit(idx - idx[0], t, 1)
+				self.offset -= self.period*idx[0]
+
+		if len(self.points) < 2:
+			#Not enough data for a fit yet. Anchor the nominal rate on the earliest receive time so far
+			self.offset = self.lowest
+		return self.offset + index*self.period
+
+	def drift(self):
+		"""
+		:return the relative deviation of the sensor's actual sample rate from the nominal one (e.g. 1e-5 for 10 ppm fast)
+		"""
+		return self.nominal_period / self.period - 1
+
+def reconstruct_times(index, rx_times, data_rate, window=None):
+	"""
+	Rebuild the sample times of a whole recording at once
+	:param index array of the sample index of each frame, increasing (see framing.sample_index)
+	:param rx_times array of the host receive time of each frame
+	:param data_rate the nominal sample rate in Hz
+	:param window the number of samples over which the earliest receive time is taken. Defaults to one second of data
+	:return times, drift where times is the array of estimated sample times
+		and drift the relative deviation of the actual sample rate from the nominal one
+	"""
+	index = np.asarray(index, dtype=np.float64)
+	rx_times = np.asarray(rx_times, dtype=np.float64)
+	window = int(data_rate) if window == None else window
+	nominal_period = 1.0 / data_rate
+
+	#Earliest receive time relative to the nominal rate in each window
+	residual = rx_times - index*nominal_period
+	bins = ((index - index[0]) // window).astype(np.int64)
+	order = np.lexsort((residual, bins))
+	first = np.ones(len(order), dtype=bool)
+	first[1:] = bins[order][1:] != bins[order][:-1]
+	best = order[first]
+
+	if len(best) < 2:
+		period = nominal_period
+		offset = np.min(residual)
+	else:
+		period, offset = np.polyfit(index[best] - index[0], rx_times[best], 1)
+		offset -= period*index[0]
+	return offset + index*period, nominal_period / period - 1
@@ -9,7 +9,6 @@ from numpy import random
 import time
 import sys
 import crc
-import codecs
 import struct
 
 INIT_BYTE = 0xAA
@@ -221,18 +220,11 @@ class virtual_sensor:
 
 	def toBytesList(self, string):
 		"""
-		Split a hexadecimal string of any length into a list of bytes
-		:param string the hexadecimal string to convert
+		Wrap the bytes read from the port in a bytearray, which can be indexed
+		and sliced like a list of ints without converting each byte separately
+		:param string the bytes to convert
 		"""
-
-		string = codecs.encode(string, 'hex')
-
-		#Watch out for leading zeros
-		if len(string) % 2 != 0:
-			string = '0' + string
-
-		#Split into list and return
-		return [int(string[i:i+2],16) for i in range(0,len(string),2)]
+		return bytearray(string)
 
 	def read(self, n):
 		try:
@@ -244,7 +236,7 @@ class virtual_sensor:
 				self.port.close()
 				sys.exit(0)
 			print('Connection problem. Read failed')
-			return ''
+			return bytearray()
 
 	def run(self):
 		"""
@@ -255,7 +247,7 @@ class virtual_sensor:
 		while (True):
 			cmd = []
 
-			while(cmd == []):
+			while not cmd:
 				#Wait for new command while executing current one (send packages if start_data_transfer was called)
 				if self.send_flag:
 					self.sendPackage()